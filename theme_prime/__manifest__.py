@@ -25,6 +25,7 @@
     ],
     'data': [
         'data/theme.ir.attachment.csv',
+        'data/ir_cron_data.xml',
 
         'views/sidebar.xml',
         'views/templates.xml',
@@ -0,0 +1,111 @@
+# -*- coding: utf-8 -*-
+# Copyright (c) 2019-Present Droggol Infotech Private Limited. (<https://www.droggol.com/>)
+
+""" Benchmark of the shop attribute facet counts (ProductTemplate._get_product_attrib_count).
+
+    Compares the product bitmap counting of models/product_template.py with the previous nested set
+    intersection on synthetic catalogs and checks that both give the same counts. Standalone, no Odoo needed:
+    the bitmap functions are extracted from the module source.
+
+        python3 theme_prime/benchmarks/bench_attrib_bitmap_count.py
+        python3 theme_prime/benchmarks/bench_attrib_bitmap_count.py --templates 100000 --values 5000
+"""
+
+import argparse
+import ast
+import pathlib
+import random
+import time
+
+MODULE_PATH = pathlib.Path(__file__).resolve().parent.parent / 'models' / 'product_template.py'
+SCENARIOS = [(2000, 200), (20000, 1000), (100000, 5000)]
+
+
+def load_bitmap_count():
+    """ _dr_attrib_bitmap_count (and its helper) compiled from the module source """
+    tree = ast.parse(MODULE_PATH.read_text())
+    functions = [node for node in tree.body if isinstance(node, ast.FunctionDef) and node.name in ('_dr_product_bitmap', '_dr_attrib_bitmap_count')]
+    namespace = {}
+    exec(compile(ast.Module(body=functions, type_ignores=[]), str(MODULE_PATH), 'exec'), namespace)
+    return namespace['_dr_attrib_bitmap_count']
+
+
+def legacy_attrib_count(query_res, attrib_values):
+    """ Previous implementation: intersection of python sets in a query_res x query_res loop """
+    attrib_values_ids = [v[1] for v in attrib_values]
+
+    attrib_vals_map = {}
+    for line in query_res:
+        attrib_vals_map.setdefault(line['product_attrib_id'], []).append(line['id'])
+
+    attrib_p_list = {}
+    for line in query_res:
+        attrib_id_1 = line.get('product_attrib_id')
+        attrib_p_list.setdefault(attrib_id_1, set())
+        if line.get('id') in attrib_values_ids:
+            attrib_p_list[attrib_id_1] = attrib_p_list[attrib_id_1] | set(line.get('product_tmpl_ids') or [])
+
+    attrib_product_list = {}
+    for line in query_res:
+        value_id_1 = line.get('id')
+        attrib_id_1 = line.get('product_attrib_id')
+        if not attrib_product_list.get(value_id_1):
+            attrib_product_list[value_id_1] = set(line.get('product_tmpl_ids') or [])
+        for line_2 in query_res:
+            value_id_2 = line_2.get('id')
+            if value_id_2 not in attrib_vals_map.get(attrib_id_1, []) and value_id_2 in attrib_values_ids:
+                attrib_product_list[value_id_1] = attrib_product_list[value_id_1] & attrib_p_list.get(line_2.get('product_attrib_id'), set())
+    return {value_id: len(product_ids) for value_id, product_ids in attrib_product_list.items()}
+
+
+def synthetic_catalog(nb_templates, nb_values, values_per_attribute=20, attributes_per_template=8, seed=0):
+    """ :return: tuple (query_res as fetched by _get_product_attrib_count, selected attrib_values [[attribute id, value id]]) """
+    rng = random.Random(seed)
+    nb_attributes = max(nb_values // values_per_attribute, attributes_per_template)
+    attribute_values = {attrib_id: [] for attrib_id in range(1, nb_attributes + 1)}
+    for value_id in range(1, nb_values + 1):
+        attribute_values[(value_id - 1) % nb_attributes + 1].append(value_id)
+
+    value_products = {value_id: [] for value_id in range(1, nb_values + 1)}
+    for product_id in range(1, nb_templates + 1):
+        for attrib_id in rng.sample(range(1, nb_attributes + 1), attributes_per_template):
+            for value_id in rng.sample(attribute_values[attrib_id], rng.randint(1, 2)):
+                value_products[value_id].append(product_id)
+
+    query_res = [{
+        'id': value_id,
+        'product_attrib_id': (value_id - 1) % nb_attributes + 1,
+        'product_tmpl_ids': product_ids,
+    } for value_id, product_ids in value_products.items()]
+    attrib_values = [[attrib_id, value_id] for attrib_id in rng.sample(range(1, nb_attributes + 1), 3) for value_id in rng.sample(attribute_values[attrib_id], 2)]
+    return query_res, attrib_values
+
+
+def timed(function, *args):
+    start = time.perf_counter()
+    result = function(*args)
+    return result, time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--templates', type=int, help="number of product templates (default: all the scenarios)")
+    parser.add_argument('--values', type=int, help="number of attribute values")
+    parser.add_argument('--skip-legacy', action='store_true', help="only time the bitmap counting")
+    args = parser.parse_args()
+
+    bitmap_count = load_bitmap_count()
+    scenarios = [(args.templates, args.values or args.templates // 20)] if args.templates else SCENARIOS
+    for nb_templates, nb_values in scenarios:
+        query_res, attrib_values = synthetic_catalog(nb_templates, nb_values)
+        counts, bitmap_time = timed(bitmap_count, query_res, {v[1] for v in attrib_values})
+        line = f"{nb_templates:>7} templates / {nb_values:>5} values: bitmap {bitmap_time:8.3f}s"
+        if not args.skip_legacy:
+            legacy_counts, legacy_time = timed(legacy_attrib_count, query_res, attrib_values)
+            assert counts == legacy_counts, "bitmap counts differ from the previous implementation"
+            line += f"  previous {legacy_time:8.3f}s  (x{legacy_time / bitmap_time:.1f}, same counts)"
+        print(line)
+
+
+if __name__ == '__main__':
+    main()
@@ -1,28 +1,30 @@
 # -*- coding: utf-8 -*-
 # Copyright (c) 2019-Present Droggol Infotech Private Limited. (<https://www.droggol.com/>)
 
-import base64
-import io
 import json
-import re
+import logging
 import string
+import time
 from collections import defaultdict
 import datetime
 
-try:
-    from werkzeug.utils import send_file
-except ImportError:
-    from odoo.tools._vendor.send_file import send_file
-
 from odoo import _, http
 from odoo.addons.website.controllers.main import Website
 from odoo.addons.website_sale.controllers.main import WebsiteSale
 from odoo.addons.website_sale_wishlist.controllers.main import WebsiteSaleWishlist
+from odoo.addons.theme_prime.models.website import dr_search_cache, dr_term_matcher
 from odoo.addons.website_sale.controllers.combo_configurator import (WebsiteSaleComboConfiguratorController)
 from odoo.http import request
 from odoo.osv import expression
-from odoo.tools import html_escape, file_path, file_open
-from odoo.tools.mimetypes import guess_mimetype
+from odoo.tools import file_path
+
+_logger = logging.getLogger(__name__)
+
+QUICK_VIEW_CACHE_TTL = 600
+# Max snippet requests of one /theme_prime/get_snippets_data batch (keep in sync with snippet_root_widget.js)
+SNIPPET_DATA_BATCH_LIMIT = 50
+# Max search report entries accepted in one request (the searchbar queues at most 10)
+SEARCH_REPORT_LIMIT = 20
 
 
 class ThemePrimeWebsiteSale(WebsiteSale):
@@ -42,14 +44,8 @@ class ThemePrimeWebsiteSale(WebsiteSale):
         # Rating
         ratings = request.httprequest.args.getlist('rating')
         if ratings and search_rating:
-            result = request.env['rating.rating'].sudo().read_group([('res_model', '=', 'product.template')], ['rating:avg'], groupby=['res_id'], lazy=False)
-            rating_product_ids = []
-            for rating in ratings:
-                rating_product_ids.extend([item['res_id'] for item in result if item['rating'] >= int(rating)])
-            if rating_product_ids:
-                domains = expression.AND([domains, [('id', 'in', rating_product_ids)]])
-            else:
-                domains = expression.AND([domains, [('id', 'in', [])]])
+            # Selected ratings are "n stars & up" so the lowest one covers all the others
+            domains = expression.AND([domains, [('dr_rating_bucket', '>=', min(int(rating) for rating in ratings))]])
         return domains
 
     def _get_search_options(self, category=None, attrib_values=None, tags=None, pricelist=None, min_price=0.0, max_price=0.0, conversion_rate=1, **post):
@@ -58,6 +54,8 @@ class ThemePrimeWebsiteSale(WebsiteSale):
             res['hide_out_of_stock'] = request.httprequest.args.get('hide_out_of_stock')
         if post.get('rating') != 'skip' and request.httprequest.args.getlist('rating'):
             res['rating'] = request.httprequest.args.getlist('rating')
+        # Searched products are sorted by relevance unless the visitor picked a sort order
+        res['dr_rank'] = not post.get('order')
         return res
 
     def _shop_get_query_url_kwargs(self, category, search, min_price, max_price, attrib=None, order=None, tags=None, **post):
@@ -94,20 +92,23 @@ class ThemePrimeWebsiteSale(WebsiteSale):
 
             fuzzy_search_term = response.qcontext.get('search') or search
             pricelist, category = response.qcontext.get('pricelist'), response.qcontext.get('category')
-            if request.website._get_dr_theme_config('json_shop_filters')['show_category_count']:
-                # Categories
-                domain = self._prepare_filters_domain(search=fuzzy_search_term, attrib_values=attrib_values, pricelist=pricelist, min_price=min_price, max_price=max_price, **post)
-                response.qcontext.update(get_category_count=ProductTemplate._get_product_category_count(domain=domain))
-            if request.website._get_dr_theme_config('json_shop_filters')['show_attribute_count'] or request.website._get_dr_theme_config('json_shop_filters')['hide_extra_attrib_value']:
-                # Attributes
-                domain = self._prepare_filters_domain(search=fuzzy_search_term, category=category, pricelist=pricelist, min_price=min_price, max_price=max_price, **post)
-                response.qcontext.update(get_attrib_count=ProductTemplate._get_product_attrib_count(attrib_values, domain=domain))
-
-                # Rating
-                domain = self._prepare_filters_domain(search=fuzzy_search_term, attrib_values=attrib_values, category=category, pricelist=pricelist, min_price=min_price, max_price=max_price, **{**post, 'rating': 'skip'})
-                response.qcontext.update(get_ratings_count=ProductTemplate._get_product_rating_count(domain=domain))
-
             selected_ratings = [int(x) for x in request_args.getlist('rating')]
+            _config_shop_filters = request.website._get_dr_theme_config('json_shop_filters')
+            facets = []
+            if _config_shop_filters['show_category_count']:
+                facets.append('category')
+            if _config_shop_filters['show_attribute_count'] or _config_shop_filters['hide_extra_attrib_value']:
+                facets += ['attribute', 'rating']
+            if facets:
+                # Filters shared by all facets, each facet family applies the selected category, attributes and rating except its own
+                domain = self._prepare_filters_domain(search=fuzzy_search_term, pricelist=pricelist, min_price=min_price, max_price=max_price, **{**post, 'rating': 'skip'})
+                facet_counts = ProductTemplate._get_product_facet_counts(
+                    domain, category_id=category and category.id, attrib_values=attrib_values, min_rating=selected_ratings and min(selected_ratings), facets=facets)
+                if 'category' in facet_counts:
+                    response.qcontext.update(get_category_count=facet_counts['category'])
+                if 'attribute' in facet_counts:
+                    response.qcontext.update(get_attrib_count=facet_counts['attribute'], get_ratings_count=facet_counts['rating'])
+
             selected_hide_out_of_stock = request_args.get('hide_out_of_stock')
 
             _config_shop_layout = request.website._get_dr_theme_config('json_shop_layout')
@@ -117,7 +118,7 @@ class ThemePrimeWebsiteSale(WebsiteSale):
             response.qcontext.update(
                 _config_shop_layout=_config_shop_layout,
                 _config_product_item=request.website._get_dr_theme_config('json_shop_product_item'),
-                _config_shop_filters=request.website._get_dr_theme_config('json_shop_filters'),
+                _config_shop_filters=_config_shop_filters,
                 _config_category_pills=request.website._get_dr_theme_config('json_shop_category_pills'),
                 view_mode=request_args.get('view_mode', _config_shop_layout.get('default_view_mode')),
                 page=page,
@@ -131,16 +132,19 @@ class ThemePrimeWebsiteSale(WebsiteSale):
     def _prepare_filters_domain(self, search=None, pricelist=None, category=None, attrib_values=None, min_price=None, max_price=None, **post):
         options = self._get_search_options(category=category, attrib_values=attrib_values, pricelist=pricelist, min_price=min_price, max_price=max_price, **post)
         search_detail = request.website._search_get_details('products_only', None, options)[0]
-        search_fields = search_detail['search_fields']
-        base_domain = search_detail['base_domain']
-        return request.env['product.template']._search_build_domain(base_domain, search, search_fields, search_detail.get('search_extra'))
+        # Same products as the shop results (full text index or ilike fallback, see _search_fetch)
+        return request.env['product.template']._dr_search_domain(search_detail, search)[0]
 
     def _prepare_product_values(self, product, category, search, **kwargs):
         res = super()._prepare_product_values(product, category, search, **kwargs)
         if request.website._get_dr_theme_config('bool_show_products_nav'):
-            ProductTemplate = request.env['product.template']
-            res['prev_product_id'] = ProductTemplate.search([('website_sequence', '<', product.website_sequence)] + request.website.website_domain(), limit=1, order='website_sequence desc')
-            res['next_product_id'] = ProductTemplate.search([('website_sequence', '>', product.website_sequence)] + request.website.website_domain(), limit=1, order='website_sequence')
+            product_nav = request.website._dr_get_product_nav(product)
+            if product_nav:
+                res['prev_product_id'], res['next_product_id'] = product_nav
+            else:
+                ProductTemplate = request.env['product.template']
+                res['prev_product_id'] = ProductTemplate.search([('website_sequence', '<', product.website_sequence)] + request.website.website_domain(), limit=1, order='website_sequence desc')
+                res['next_product_id'] = ProductTemplate.search([('website_sequence', '>', product.website_sequence)] + request.website.website_domain(), limit=1, order='website_sequence')
         return res
 
     @http.route()
@@ -168,7 +172,6 @@ class ThemePrimeWebsiteSale(WebsiteSale):
 
     @http.route('/theme_prime/get_quick_view_html', type='json', auth='public', website=True)
     def get_quick_view_html(self, options, **kwargs):
-        IrUiView = request.env['ir.ui.view']
         product_tmpl_id = options.get('product_tmpl_id')
         product_id = options.get('product_id')
         extra = {}
@@ -183,18 +186,49 @@ class ThemePrimeWebsiteSale(WebsiteSale):
         if not product:
             return False
 
-        values = self._prepare_product_values(product, category='', search='', **kwargs)
-        result = request.website.get_theme_prime_shop_config()
-        values.update(result)
-        values.update(extra)
-
+        shop_config = request.website.get_theme_prime_shop_config()
         if options.get('variant_selector'):
-            values['auto_add_product'] = product.product_variant_count == 1
-            return IrUiView._render_template('theme_prime.product_variant_selector_dialog', values=values)
-
-        if options.get('right_panel'):
-            return IrUiView._render_template('theme_prime.tp_product_right_panel', values=values)
-        return IrUiView._render_template('theme_prime.tp_product_quick_view', values=values)
+            template = 'theme_prime.product_variant_selector_dialog'
+        elif options.get('right_panel'):
+            template = 'theme_prime.tp_product_right_panel'
+        else:
+            template = 'theme_prime.tp_product_quick_view'
+
+        def prepare_values():
+            values = self._prepare_product_values(product, category='', search='', **kwargs)
+            values.update(shop_config)
+            values.update(extra)
+            if options.get('variant_selector'):
+                values['auto_add_product'] = product.product_variant_count == 1
+            return values
+
+        csrf_token = request.csrf_token()
+        html, cached_csrf_token = request.website._dr_render_quick_view(
+            template, product.id, product_id or False, self._get_quick_view_cache_key(product, shop_config, kwargs), csrf_token, prepare_values)
+        return html.replace(cached_csrf_token, csrf_token) if cached_csrf_token != csrf_token else html
+
+    def _get_quick_view_cache_key(self, product, shop_config, kwargs):
+        """ Everything the quick view html depends on besides the template and the product.
+
+            Ratings are updated by SQL (no write date) so they are part of the key. The sold quantity and the pricelist
+            rules reaching their end date are not tracked, the time bucket refreshes them every QUICK_VIEW_CACHE_TTL seconds.
+            The html is shared between users, only what it shows of the user is part of the key.
+        """
+        website = request.website
+        user = request.env.user
+        variants = product.product_variant_ids
+        wishlist_variant_ids = request.env['product.wishlist'].current().product_id & variants
+        stock = tuple(variants.sudo().mapped('free_qty')) if product.is_storable else False
+        # Prefilled email of the back in stock notification form
+        notification_email = product.is_storable and (user.partner_id.email or request.session.get('stock_notification_email', ''))
+        return (
+            request.env.lang, website.pricelist_id.id, website.fiscal_position_id.id, website._dr_has_b2b_access(),
+            user._is_public(), user._is_internal(), notification_email,
+            website._dr_get_cache_versions(['catalog', 'pricelist']),
+            product.dr_rating_avg, product.dr_rating_count, int(time.time() // QUICK_VIEW_CACHE_TTL),
+            max([product.write_date] + variants.mapped('write_date')), stock, tuple(wishlist_variant_ids.ids),
+            json.dumps(shop_config, sort_keys=True, default=str), json.dumps(kwargs, sort_keys=True, default=str),
+        )
 
     @http.route()
     def cart_update_json(
@@ -286,25 +320,18 @@ class ThemePrimeMainClass(http.Controller):
             final_domain = [('id', 'in', product_tmpl_ids)]
             order = None
 
+        Product = request.env[res_model].with_context(pricelist=pricelist.id)
         # bestseller is not a real field
-        bestseller_ids, old_limit = [], limit
         if order == 'bestseller':
-            bestseller_ids, limit, order = self._get_bestseller_products(old_limit)
-
-        products = request.env[res_model].with_context(pricelist=pricelist.id).search(final_domain, limit=limit, order=order)
+            products = self._get_bestseller_products(Product, final_domain, limit, options.get('category_id'))
+        else:
+            products = Product.search(final_domain, limit=limit, order=order)
 
         if temp_order == 'last_viewed' and len(product_tmpl_ids):
             products = products.sorted(lambda p: product_tmpl_ids.index(p.id))
         default_fields = ['id', 'name', 'website_url', 'default_code']
         fields = set(default_fields + fields)
 
-        if bestseller_ids:
-            bestseller_ids_filtered = set(bestseller_ids) & set(products.ids)
-            bestseller_sorted_ids = [p_id for p_id in bestseller_ids if p_id in bestseller_ids_filtered]
-            remain_products = set(products.ids) - set(bestseller_sorted_ids)
-            final_product_ids = bestseller_sorted_ids + list(remain_products)
-            products = request.env[res_model].with_context(pricelist=pricelist.id).browse(final_product_ids[:old_limit])
-
         return self._prepare_product_data(products, fields, pricelist, options)
 
     def _get_last_viewed_products(self, domain, res_model, limit):
@@ -315,13 +342,18 @@ class ThemePrimeMainClass(http.Controller):
     def _prepare_product_data(self, products, fields, pricelist, options=None):
 
         options = options or {}
-        price_public_visibility = request.website._dr_has_b2b_access()
+        price_public_visibility = self._dr_has_b2b_access()
         visibility_label = False
         showStockLabel = False
         res_model = options.get('model', 'product.template')
 
+        # Products shown by several snippets of a batched request are prepared once
+        product_data_cache = request.env.cr.cache.setdefault('dr_product_data', {})
+        cache_key = (res_model, pricelist.id, tuple(sorted(fields)))
+        all_products, products = products, products.filtered(lambda p: (cache_key, p.id) not in product_data_cache)
+
         if not price_public_visibility:
-            visibility_label = self._get_tp_view_template('theme_prime.tp_b2b_price_label')
+            visibility_label = self._get_b2b_price_label()
 
         extra_data = {'rating', 'offer_data', 'dr_stock_label', 'colors'} & set(fields)
         fields = list(set(fields) - extra_data)
@@ -331,21 +363,25 @@ class ThemePrimeMainClass(http.Controller):
         currency_id = pricelist.currency_id or request.website.company_id.currency_id
 
         result = products.read(fields)
+        if res_model == 'product.template':
+            # Batched passes for the whole recordset
+            combination_infos = products._dr_get_combination_info_batch(request.website)
+            first_variant_ids = products._dr_get_first_possible_variant_ids()
+        # Variants can have their own image, only the templates have derivatives
+        derivative_product_ids = products._dr_get_image_derivative_product_ids() if res_model == 'product.template' else set()
         for res_product, product in zip(result, products):
             if res_model == 'product.product':
                 combination_info = product.product_tmpl_id._get_combination_info(product_id=product.id)
                 res_product['name'] = product.with_context(display_default_code=False).display_name
             else:
-                combination_info = product._get_combination_info(only_template=True)
+                combination_info = combination_infos[product.id]
             res_product.update(combination_info)
             price_info = self._get_computed_product_price(product, res_product, price_public_visibility, visibility_label, currency_id)
             res_product.update(price_info)
-            res_product['product_variant_id'] = product._get_first_possible_variant_id() if res_model == 'product.template' else product.id
+            res_product['product_variant_id'] = first_variant_ids[product.id] if res_model == 'product.template' else product.id
 
             # Images
-            res_product['img_small'] = request.website.image_url(product, 'image_256')
-            res_product['img_medium'] = request.website.image_url(product, 'image_512')
-            res_product['img_large'] = request.website.image_url(product, 'image_1024')
+            res_product.update(request.website._dr_get_product_image_urls(product, product.id in derivative_product_ids))
 
             # short Description
             if 'description_ecommerce' in fields:
@@ -353,14 +389,19 @@ class ThemePrimeMainClass(http.Controller):
                 res_product['short_description'] = description[:100] + '...' if description and len(description) > 100 else description or False
             # label and color
             if 'colors' in extra_data:
-                res_product['colors'] = self._get_tp_view_template('theme_prime.product_preview_swatches', {'product': product if res_model == 'product.template' else product.product_tmpl_id, '_limit': 4, 'parent_selector': '.card', 'img_selector': '.d-product-img'})
+                template = product if res_model == 'product.template' else product.product_tmpl_id
+                # Swatches also show the colors and images of the attribute values
+                template_values = template.attribute_line_ids.product_template_value_ids
+                swatch_write_dates = template.product_variant_ids.mapped('write_date') + template_values.mapped('write_date') \
+                    + template_values.product_attribute_value_id.mapped('write_date') + template_values.attribute_id.mapped('write_date')
+                res_product['colors'] = self._get_tp_record_view_template('theme_prime.product_preview_swatches', template, {'product': template, '_limit': 4, 'parent_selector': '.card', 'img_selector': '.d-product-img'}, extra_key=max(swatch_write_dates, default=False))
             # label and color
             if 'dr_label_id' in fields and product.dr_label_id:
                 res_product['label'] = product.dr_label_id
                 res_product['label_id'] = product.dr_label_id.id
-                res_product['label_template'] = self._get_tp_view_template('theme_prime.product_label', {'label': product.dr_label_id})
+                res_product['label_template'] = self._get_tp_record_view_template('theme_prime.product_label', product.dr_label_id, {'label': product.dr_label_id})
             if 'dr_stock_label' in extra_data and showStockLabel and product.dr_show_out_of_stock:
-                res_product['dr_stock_label'] = self._get_tp_view_template('theme_prime.product_label', {'product': product, 'stock': True})
+                res_product['dr_stock_label'] = self._get_tp_record_view_template('theme_prime.product_label', product, {'product': product, 'stock': True}, extra_key=('stock', product.dr_show_out_of_stock))
                 res_product['dr_show_out_of_stock'] = product.dr_show_out_of_stock
             # rating
             if 'offer_data' in extra_data:
@@ -395,40 +436,76 @@ class ThemePrimeMainClass(http.Controller):
                         'name': product.dr_brand_value_id.name,
                         'id': product.dr_brand_value_id.id,
                     }
+            product_data_cache[(cache_key, product.id)] = res_product
 
-        return result
+        return [dict(product_data_cache[(cache_key, product.id)]) for product in all_products]
+
+    def _dr_has_b2b_access(self):
+        cache = request.env.cr.cache.setdefault('dr_snippet_context', {})
+        if 'b2b_access' not in cache:
+            cache['b2b_access'] = request.website._dr_has_b2b_access()
+        return cache['b2b_access']
+
+    def _get_b2b_price_label(self):
+        cache = request.env.cr.cache.setdefault('dr_snippet_context', {})
+        if 'b2b_price_label' not in cache:
+            cache['b2b_price_label'] = self._get_tp_view_template('theme_prime.tp_b2b_price_label')
+        return cache['b2b_price_label']
 
     def _get_computed_product_price(self, product, product_data, price_public_visibility, visibility_label, currency_id):
-        FieldMonetary = request.env['ir.qweb.field.monetary']
-        monetary_options = {'display_currency': currency_id}
         return {
             'visibility': price_public_visibility,
             'price_raw': product_data['price'] if price_public_visibility else visibility_label,
             'list_price_raw': product_data['list_price'] if price_public_visibility else ' ',
-            'price': FieldMonetary.value_to_html(product_data['price'], monetary_options) if price_public_visibility else visibility_label,
-            'list_price': FieldMonetary.value_to_html(product_data['list_price'], monetary_options) if price_public_visibility else ' '
+            'price': self._get_formatted_price(product_data['price'], currency_id) if price_public_visibility else visibility_label,
+            'list_price': self._get_formatted_price(product_data['list_price'], currency_id) if price_public_visibility else ' '
         }
 
+    def _get_formatted_price(self, amount, currency_id):
+        # Snippet products share a few price points, format each one once per request
+        formatted_prices = request.env.cr.cache.setdefault('dr_formatted_prices', {})
+        key = (amount, currency_id.id, request.env.lang)
+        if key not in formatted_prices:
+            formatted_prices[key] = request.env['ir.qweb.field.monetary'].value_to_html(amount, {'display_currency': currency_id})
+        return formatted_prices[key]
+
     def _get_tp_view_template(self, tmpl, values={}):
         IrUiView = request.env['ir.qweb']
         values.update({'request': request})
         return IrUiView._render(tmpl, values=values, minimal_qcontext=True)
 
-    def _get_bestseller_products(self, old_limit):
-        past_date = datetime.datetime.now() - datetime.timedelta(days=30)
-        result = request.env['sale.report'].sudo().read_group([('date', '>', past_date), ('website_id', '=', request.website.id), ('state', 'in', ['sale', 'done'])], ['product_tmpl_id', 'product_uom_qty:sum'], ['product_tmpl_id'], orderby="product_uom_qty desc")
-        return [product_line['product_tmpl_id'][0] for product_line in result], None if len(result) else old_limit, None
+    def _get_tp_record_view_template(self, tmpl, record, values, extra_key=None):
+        """ Same as _get_tp_view_template for fragments depending only on ``record`` (and ``extra_key``),
+            rendered once per record version, language and website.
+        """
+        values.update({'request': request})
+        return request.website._dr_render_fragment(tmpl, record._name, record.id, record.write_date, request.env.lang, extra_key, values)
+
+    def _get_bestseller_products(self, Product, domain, limit, category_id=None):
+        """ Products of the domain in the order of the precomputed bestseller ranking, completed with other products """
+        bestseller_ids = request.env['product.template']._dr_get_bestseller_ids(request.website, category_id)
+        rank = {p_id: index for index, p_id in enumerate(bestseller_ids)}
+        products = Product.search(expression.AND([domain, [('id', 'in', bestseller_ids)]])).sorted(lambda p: rank[p.id])[:limit or None]
+        if not limit or len(products) < limit:
+            products |= Product.search(expression.AND([domain, [('id', 'not in', products.ids)]]), limit=limit and limit - len(products) or None)
+        return products
 
     def _get_shop_related_data(self, options):
+        # Same for all the snippets of a batched request
+        cache = request.env.cr.cache.setdefault('dr_snippet_context', {})
+        cache_key = ('shop_data', bool(options.get('shop_config_params')), bool(options.get('wishlist_enabled')))
+        if cache_key in cache:
+            return dict(cache[cache_key])
         shop_data = {}
         if (options.get('shop_config_params')):
             shop_data['shop_config_params'] = request.website.get_theme_prime_shop_config()
         if (options.get('wishlist_enabled')) and shop_data.get('shop_config_params', {}).get('is_wishlist_active'):
             shop_data['wishlist_products'] = request.env['product.wishlist'].with_context(display_default_code=False).current().mapped('product_id').ids
-        return shop_data
+        cache[cache_key] = shop_data
+        return dict(shop_data)
 
     def _get_rating_template(self, rating_avg, rating_count=False):
-        return request.website._get_theme_prime_rating_template(rating_avg, rating_count)
+        return request.website._dr_get_rating_template_cached(rating_avg, rating_count, request.env.lang)
 
     def _get_categories(self, domain=[], fields=['name', 'display_name', 'id'], limit=20, order=None, extras={}):
         final_domain = expression.AND([request.website.website_domain(), domain])
@@ -455,18 +532,10 @@ class ThemePrimeMainClass(http.Controller):
         return result
 
     def _get_products_for_top_categories(self, params):
-        result = {}
-        categoryIDs = params.get('categoryIDs')
-        order = params.get('sortBy')
-        operator = '='
-        if params.get('includesChild'):
-            operator = 'child_of'
-        initial_domain = expression.AND([request.website.website_domain(), [('website_published', '=', True)]])
-        for id in categoryIDs:
-            domain = expression.AND([initial_domain, [['public_categ_ids', operator, id]]])
-            products = self._get_products(domain, ['id'], 4, order)
-            result[id] = [product['id'] for product in products]
-        return result
+        """ :return: tuple (category_id -> top 4 product ids, category_id -> cheapest product id) """
+        domain = expression.AND([request.website.sale_product_domain(), request.website.website_domain(), [('website_published', '=', True)]])
+        return request.env['product.template']._dr_get_top_products_by_category(
+            domain, list(params.get('categoryIDs')), 4, order=params.get('sortBy'), include_child=params.get('includesChild'))
 
     def _get_pricelist_data(self, fields=['name'], limit=20, order=None, extras={}):
         pricelists = request.env['product.pricelist'].search([('id', 'in', request.website.get_pricelist_available(show_visible=True).ids)], limit=limit, order=order)
@@ -630,7 +699,6 @@ class ThemePrimeMainClass(http.Controller):
     def get_top_categories(self, options={}):
         params = options.get('params')
         result = []
-        website_sale_domain = request.website.sale_product_domain()
         if params:
             categoryIDs = params.get('categoryIDs')
             if categoryIDs:
@@ -639,8 +707,12 @@ class ThemePrimeMainClass(http.Controller):
                 # Update categoryIDs if already set category moved to other website
                 categoryIDs = category_names.keys()
                 params['categoryIDs'] = categoryIDs
-                categories = self._get_products_for_top_categories(params)
-                price_public_visibility = request.website._dr_has_b2b_access()
+                categories, cheapest_product_ids = self._get_products_for_top_categories(params)
+                price_public_visibility = self._dr_has_b2b_access()
+                # Product data (price) is prepared once for the cheapest products of all categories
+                pricelist = request.website.pricelist_id
+                cheapest_products = request.env['product.template'].with_context(pricelist=pricelist.id).browse(set(cheapest_product_ids.values()))
+                cheapest_products_data = {product['id']: product for product in self._prepare_product_data(cheapest_products, ['id', 'name', 'website_url', 'default_code'], pricelist)}
                 for category_id in categoryIDs:
                     category_data = {}
                     product_ids = categories.get(category_id)
@@ -648,10 +720,8 @@ class ThemePrimeMainClass(http.Controller):
                     category_data['id'] = category_id
                     category_data['website_url'] = '/shop/category/' + str(category_id)
                     category_data['productIDs'] = product_ids
-                    final_domain = expression.AND([website_sale_domain, [('public_categ_ids', 'child_of', category_id)]])
-                    products = self._get_products(domain=final_domain, fields=[], limit=1, order="list_price asc")
-                    if len(products):
-                        category_data['min_price'] = products[0].get('price')
+                    if category_id in cheapest_product_ids:
+                        category_data['min_price'] = cheapest_products_data[cheapest_product_ids[category_id]].get('price')
                         category_data['price_public_visibility'] = price_public_visibility
                     result.append(category_data)
         return result
@@ -707,52 +777,93 @@ class ThemePrimeMainClass(http.Controller):
     @http.route('/theme_prime/get_megamenu_categories', type='json', auth='public', website=True)
     def get_megamenu_categories(self, options={}, limit=5, fields=['name', 'id'], order='count', **kwargs):
         category_ids = request.env['product.public.category'].browse(options.get('categoryIDs', [])).exists().ids
-        final_domain = expression.AND([request.website.website_domain(), [('parent_id', 'child_of', category_ids)]])
-        categories = request.env['product.public.category'].search(final_domain, limit=None)
-
-        all_categories = []
-        all_category_count = request.env['product.template']._get_product_category_count(request.env['website'].sale_product_domain())
-        for category in categories:
-            all_categories.append({
-                'id': category.id, 'name': category.name, 'parent_id': category.parent_id.id,
-                'count': all_category_count.get(category['id'], 0),
-                'website_url': '/shop/category/' + str(category.id),
-                'image_url': '/web/image?model=product.public.category&id=%d&field=image_512' % (category.id),
-                'cover_image': '/web/image?model=product.public.category&id=%d&field=dr_category_cover_image' % (category.id),
-                'dr_category_icon': '/web/image?model=product.public.category&id=%d&field=dr_category_icon' % (category.id),
-                'category_label_info': category.dr_category_label_id and {f: category.dr_category_label_id[f] for f in ['name', 'background_color', 'text_color']} or False,
-            })
+        return request.website._dr_get_megamenu_categories(category_ids, limit, order, options.get('onlyDirectChild', False))
+
+    # Snippet routes which can be requested through /theme_prime/get_snippets_data
+    _dr_snippet_data_routes = {
+        '/theme_prime/get_products_data': 'get_products_data',
+        '/theme_prime/get_listing_products': 'get_listing_products',
+        '/theme_prime/get_tab_listing_products': 'get_tab_listing_products',
+        '/theme_prime/get_products_by_category': 'get_products_by_category',
+        '/theme_prime/get_brands_category_data': 'get_brands_category_data',
+        '/theme_prime/get_top_categories': 'get_top_categories',
+        '/theme_prime/get_categories_info': 'get_categories_info',
+        '/theme_prime/get_brands': 'get_brands',
+        '/theme_prime/get_megamenu_categories': 'get_megamenu_categories',
+    }
+
+    @http.route('/theme_prime/get_snippets_data', type='json', auth='public', website=True)
+    def get_snippets_data(self, snippet_requests, **kwargs):
+        """ Data of several snippets in one round trip, website context and shared products are computed once.
+
+            :param snippet_requests: list of {'route': snippet route, 'params': route parameters}
+            :return: list of {'result': route result} or {'error': True} in the same order,
+                requests over SNIPPET_DATA_BATCH_LIMIT get {'error': 'limit'}
+        """
+        results = []
+        for snippet_request in snippet_requests[:SNIPPET_DATA_BATCH_LIMIT]:
+            method_name = self._dr_snippet_data_routes.get(snippet_request.get('route'))
+            if not method_name:
+                results.append({'error': True})
+                continue
+            try:
+                with request.env.cr.savepoint():
+                    results.append({'result': getattr(self, method_name)(**(snippet_request.get('params') or {}))})
+            except Exception:
+                _logger.warning("Snippet request %s failed", snippet_request.get('route'), exc_info=True)
+                results.append({'error': True})
+        results.extend({'error': 'limit'} for snippet_request in snippet_requests[SNIPPET_DATA_BATCH_LIMIT:])
+        return results
 
-        parent_categories = filter(lambda category: category.get('id') in category_ids, all_categories)
-        return [self._get_megamenu_child_categories(category_id, limit, all_categories, order, options) for category_id in parent_categories]
-
-    def _get_megamenu_child_categories(self, parent_category, limit, all_categories, order, options):
-        child_categories = [categ for categ in all_categories if categ.get('parent_id') == parent_category.get('id')]
-        if not child_categories:
-            return {'category': parent_category, 'child': []}
-        if order == 'count' or not order:
-            child_categories = sorted(child_categories, key=lambda category: category.get('count', 0), reverse=True)
-        child_categories = child_categories[:limit]
-        remain_limit = limit - len(child_categories)
-
-        if remain_limit <= 0 or options.get('onlyDirectChild', False):
-            return {'category': parent_category, 'child': child_categories}
-        for child_category in child_categories[:]:
-            new_born_child = self._get_megamenu_child_categories(child_category, remain_limit, all_categories, order, options).get('child')
-            child_categories.extend(new_born_child)
-            remain_limit = limit - len(child_categories)
-            if remain_limit <= 0:
-                break
-        return {'category': parent_category, 'child': child_categories}
+    @http.route('/theme_prime/product_image/<int:product_id>-<string:unique>/<int:size>', type='http', auth='public', website=True, sitemap=False, multilang=False)
+    def get_product_image(self, product_id, unique, size, **kwargs):
+        """ Product card image, the best WebP/AVIF derivative the browser accepts, else the resized original.
+            The url changes with the product (unique) so the response is immutable.
+        """
+        product = request.env['product.template'].browse(product_id).exists()
+        if not product or size not in [256, 512, 1024] or not product.has_access('read'):
+            return request.not_found()
+        accepted_mimetypes = [mimetype for mimetype, quality in request.httprequest.accept_mimetypes if quality]
+        attachment = product._dr_get_image_derivative(size, accepted_mimetypes)
+        if attachment:
+            stream = request.env['ir.binary']._get_stream_from(attachment)
+        else:
+            stream = request.env['ir.binary']._get_image_stream_from(product, 'image_%s' % size)
+        response = stream.get_response(immutable=True)
+        response.headers['Vary'] = 'Accept'
+        return response
 
 
 class ThemeWebsite(Website):
 
     @http.route('/website/dr_search', type='json', auth="public", website=True, sitemap=False)
-    def dr_search(self, term, max_nb_chars, options, **kw):
+    def dr_search(self, term, max_nb_chars, options, reports=None, **kw):
+        """ :param reports: search report entries queued by the searchbar, sent along the search to save a request """
+        search_config = request.website._get_dr_theme_config('json_product_search')
+        for report_data in (reports or [])[:SEARCH_REPORT_LIMIT]:
+            request.env['dr.search.report']._dr_buffer_report_entry(report_data)
+        cache_key, normalized_term = request.website._dr_get_search_cache_key(search_config), ' '.join(term.split()).lower()
+        cached, prefix_product_ids = dr_search_cache.lookup(cache_key, normalized_term)
+        if cached:
+            search_result = cached[0]
+        else:
+            search_result, product_ids = self._dr_search(term, search_config, prefix_product_ids)
+            dr_search_cache.set(cache_key, normalized_term, (search_result, product_ids))
+
+        if search_config.get('search_report') and search_result["result_length"] == 0:
+            report_data = {
+                'search_term': search_result['fuzzy_search'] or term,
+                'device_type': kw.get('device_type')
+            }
+            request.env['dr.search.report']._dr_buffer_report_entry(report_data)
+
+        return search_result
 
+    def _dr_search(self, term, search_config, prefix_product_ids=None):
+        """ :param prefix_product_ids: all the products matching a prefix of the term, the products of the term are among them
+            :return: search result, all the product ids matching the term (None if not known)
+        """
         fuzzy_term, global_match = False, False
-        search_config = request.website._get_dr_theme_config('json_product_search')
         # has_formulate = self._dr_has_formulate(search_config)      # TODO: MAYBE REMOVE THIS
         fuzzy_enabled = search_config.get('search_fuzzy')
         search_description = search_config.get('search_description', False)
@@ -762,13 +873,21 @@ class ThemeWebsite(Website):
         raw_term = term
         options = {'allowFuzzy': False, 'displayDescription': search_description, 'displayDetail': True, 'displayExtraLink': True, 'displayImage': True, 'display_currency': request.website.currency_id}
         if fuzzy_enabled:
-            search_details = request.website._search_get_details('products', 'name asc', {**options, 'allowFuzzy': True})
-            term = request.website._search_find_fuzzy_term(search_details, raw_term) or raw_term
+            term = request.website._dr_find_fuzzy_term(raw_term)
+            if term is None:
+                search_details = request.website._search_get_details('products', 'name asc', {**options, 'allowFuzzy': True})
+                term = request.website._search_find_fuzzy_term(search_details, raw_term) or raw_term
             fuzzy_term = term != raw_term and term
 
         product_limit = max(min(search_config.get('search_max_product'), 8), 3)
+        product_ids = None
         if product_limit:
-            results['products'] = self.autocomplete(search_type='products_only', term=term, order='name asc', limit=product_limit, options=options)
+            product_options = {**options, 'dr_matched_ids': [], 'dr_rank': True}
+            if prefix_product_ids is not None and not fuzzy_term:
+                product_options['dr_candidate_ids'] = prefix_product_ids
+            results['products'] = self.autocomplete(search_type='products_only', term=term, order='name asc', limit=product_limit, options=product_options)
+            if not fuzzy_term and results['products']['results_count'] == len(product_options['dr_matched_ids']):
+                product_ids = product_options['dr_matched_ids']
 
         pills_limit = raw_pills_limit = min(search_config.get('pills_limit'), 6)
 
@@ -780,9 +899,9 @@ class ThemeWebsite(Website):
         def _match_brands(trm, p_limit, match_any_word=None):
             splited_terms = trm.split(' ')
             brand_attributes = request.website._get_brand_attributes()
-            trm_domain = expression.OR([[('ds_name', 'ilike', tm)] for tm in splited_terms]) if match_any_word else [('ds_name', 'ilike', trm)]
-            matched_brands = request.env['product.attribute.value'].search(expression.AND([trm_domain, [('attribute_id', 'in', brand_attributes.ids)]]))
-            return {'results': [{'id': brand.id, 'attribute_id': brand.attribute_id.id, 'name': self.format_result(splited_terms, brand.ds_name)} for brand in matched_brands], 'results_count': len(matched_brands), 'parts': {}}
+            search_index = request.website._dr_get_search_index()
+            matched_brands = search_index.search(splited_terms if match_any_word else [trm], attribute_ids=set(brand_attributes.ids), fuzzy=fuzzy_enabled)
+            return {'results': [{'id': brand_id, 'attribute_id': attribute_id, 'name': self.format_result(splited_terms, ds_name)} for brand_id, attribute_id, ds_name in matched_brands], 'results_count': len(matched_brands), 'parts': {}}
 
         if search_config.get('search_category'):
             results['categories'], pills_limit = _match_categories(term, pills_limit)
@@ -802,6 +921,7 @@ class ThemeWebsite(Website):
         remain_limit = max(min(search_config.get('search_limit'), 10), 5)
         if search_config.get('search_attribute') or search_config.get('search_suggestion'):
             words = [i for i in term.split(' ') if i]   # split and filter spaces
+            matcher = dr_term_matcher(tuple(words))
             matchs, matched_dicts = False, {}
             for word in words:
                 if matchs:
@@ -809,20 +929,17 @@ class ThemeWebsite(Website):
                         match_dict = matched_dicts[match]
                         if match_dict['remaining_words']:
                             match_dict['remaining_words'].append(word)
+                        elif self._dr_consume_word(match_dict, matcher.fold(word)):
+                            match_dict['matched_words'].append(word)
                         else:
-                            unmatched_record_name = match_dict['unmatched_record_name']
-                            regex_match = re.search(re.escape(word), unmatched_record_name, re.IGNORECASE)
-                            if regex_match:
-                                match_dict['matched_words'].append(word)
-                                match_dict['unmatched_record_name'] = re.sub(re.escape(word), ' ', unmatched_record_name, flags=re.I)
-                            else:
-                                match_dict['remaining_words'].append(word)
+                            match_dict['remaining_words'].append(word)
                 else:
                     matchs = self._match_attr_or_category(word)
                     if matchs:
                         for match in matchs:
                             matched_dicts[match] = match_dict = {'match': match, 'matched_words': [word], 'remaining_words': []}
-                            match_dict['unmatched_record_name'] = re.sub(re.escape(match_dict['matched_words'][0]), ' ', match.ds_name, flags=re.I)
+                            match_dict['occurrences'], match_dict['consumed'] = list(matcher.finditer(match.ds_name)), set()
+                            self._dr_consume_word(match_dict, matcher.fold(word))
 
             match_list_raw = list(matched_dicts.values())
             match_list_raw.sort(key=lambda m: len(m['matched_words']), reverse=True)
@@ -892,15 +1009,17 @@ class ThemeWebsite(Website):
             results['products'] = self.autocomplete(search_type='products_only', term=term, order='name asc', limit=product_limit, options=options)
 
         search_result = {**results, 'fuzzy_search': fuzzy_term, 'results': [], 'global_match': global_match, 'result_length': sum([results.get(r_type, {}).get('results_count', 0) for r_type in search_types])}
+        return search_result, product_ids
 
-        if search_config.get('search_report') and search_result["result_length"] == 0:
-            report_data = {
-                'search_term': term,
-                'device_type': kw.get('device_type')
-            }
-            request.env['dr.search.report']._add_report_entry(report_data)
-
-        return search_result
+    def _dr_consume_word(self, match_dict, folded_word):
+        """ Mark the occurrences of the word in the name of the matched record as used,
+            a part of the name can only be matched by one word of the query.
+        """
+        consumed = match_dict['consumed']
+        spans = [(start, end) for start, end, word in match_dict['occurrences'] if word == folded_word and consumed.isdisjoint(range(start, end))]
+        for start, end in spans:
+            consumed.update(range(start, end))
+        return bool(spans)
 
     def _get_autocomplete_data(self, match_dict, remain_limit, search_config):
         match, remaining_words, matched_words = match_dict['match'], match_dict['remaining_words'], match_dict['matched_words']
@@ -925,8 +1044,8 @@ class ThemeWebsite(Website):
                     if len(results) >= remain_limit:
                         break
             else:
-                domain = request.website.sale_product_domain() + [('attribute_line_ids.value_ids', 'in', match.ids)]
-                all_related_records = request.env['product.template'].with_context(bin_size=True).search(domain).mapped('public_categ_ids')
+                related_category_ids = request.env['product.public.category']._dr_get_value_category_ids(request.website, match.id)
+                all_related_records = request.env['product.public.category'].browse(related_category_ids)
                 for related_match in all_related_records:
                     term = self.generate_result_dict(match, related_match, matched_words)
                     if not self.is_search_added(autocomplete_data, results, term):
@@ -949,46 +1068,33 @@ class ThemeWebsite(Website):
         all_active_attributes = self._website_active_attributes()
         matched_values = request.env['product.attribute.value']
         if all_active_attributes:
-            matched_values = matched_values.search([('ds_name', 'ilike', term), ('attribute_id', 'in', all_active_attributes.ids)])
+            matched_entries = request.website._dr_get_search_index().search([term], attribute_ids=set(all_active_attributes.ids))
+            matched_values = matched_values.browse([entry[0] for entry in matched_entries])
         return matched_values
 
     def _website_active_attributes(self):
-        all_products = request.env['product.template'].with_context(bin_size=True).search(request.website.sale_product_domain())
-        return request.env['product.attribute'].search([
-            ('product_tmpl_ids', 'in', all_products.ids), ('visibility', '=', 'visible'), ('dr_search_suggestion', '!=', False)
-        ])
+        return request.website._dr_get_active_search_attributes()
 
     def match_remaining_words(self, match, remaining_words):
+        matcher = dr_term_matcher(tuple(remaining_words))
         if match._name == 'product.public.category':
-            for word in remaining_words:
-                for attribute_value in self._category_counterpart_iterator(match):
-                    regex_match = re.search(re.escape(word), attribute_value.ds_name, re.IGNORECASE)
-                    if regex_match:
-                        yield attribute_value, word
-
-        if match._name == 'product.attribute.value':
-            domain = request.website.sale_product_domain() + [('attribute_line_ids.value_ids', 'in', match.ids)]
-            related_categories = request.env['product.template'].with_context(bin_size=True).search(domain).mapped('public_categ_ids')
-            categories = self._match_category(categories_ids=related_categories.ids)
-            for word in remaining_words:
-                for category in categories:
-                    regex_match = re.search(re.escape(word), category.ds_name, re.IGNORECASE)
-                    if regex_match:
-                        yield category, word
+            candidates = list(self._category_counterpart_iterator(match))
+        else:
+            related_category_ids = request.env['product.public.category']._dr_get_value_category_ids(request.website, match.id)
+            candidates = self._match_category(categories_ids=related_category_ids)
+        candidate_words = [(candidate, matcher.search(candidate.ds_name)) for candidate in candidates]
+        for word in remaining_words:
+            folded_word = matcher.fold(word)
+            for candidate, found_words in candidate_words:
+                if folded_word in found_words:
+                    yield candidate, word
 
     def _category_counterpart_iterator(self, category_dst, search_type=['auto_suggestion', 'auto']):
-        category = request.env['product.public.category'].browse(category_dst.id)
-        attribute_values = category.mapped('product_tmpl_ids.attribute_line_ids').filtered(lambda line: line.attribute_id.dr_search_suggestion in search_type).mapped('value_ids')
-        for value in attribute_values:
+        # Values of the category itself come first, then the ones only found in child categories
+        value_ids = request.env['product.public.category']._dr_get_category_value_ids(request.website, category_dst.id, search_type)
+        for value in request.env['product.attribute.value'].browse(value_ids):
             yield value
 
-        # Child category
-        child_categories = request.env['product.public.category'].search([('parent_id', 'child_of', category.id)]) - category
-        child_attribute_values = child_categories.mapped('product_tmpl_ids.attribute_line_ids').filtered(lambda line: line.attribute_id.dr_search_suggestion in search_type).mapped('value_ids')   # plus to maintain order
-        for value in child_attribute_values:
-            if value not in attribute_values:
-                yield value
-
     def generate_result_dict(self, primary_match, secondary_match, matched_words, word=False):
         category, attribute = (primary_match, secondary_match) if primary_match._name == 'product.public.category' else (secondary_match, primary_match)
         attribute_str = f"&attribute_value={attribute.attribute_id.id}-{attribute.id}" if attribute else ''  # just for category
@@ -1000,13 +1106,7 @@ class ThemeWebsite(Website):
         }
 
     def format_result(self, matched_words, value):
-        pattern = '|'.join(map(re.escape, matched_words))
-        parts = re.split(f'({pattern})', value, flags=re.IGNORECASE)
-        if len(parts) > 1:
-            value = request.env['ir.ui.view'].sudo()._render_template("website.search_text_with_highlight", {'parts': parts})
-            html_val = request.env[('ir.qweb.field.html')].value_to_html(value, {'template_options': {}})
-            return html_escape(html_val)
-        return False
+        return dr_term_matcher(tuple(matched_words)).highlight(value)
 
     def is_search_added(self, autocomplete_result, suggestions_results, new_term):
         auto_found = len([term for term in autocomplete_result if new_term['website_url'] == term['website_url']])
@@ -1022,8 +1122,9 @@ class ThemeWebsite(Website):
         return False
 
     @http.route('/website/dr_search/add_report', type='json', auth="public", website=True, sitemap=False)
-    def dr_search_report(self, **kw):
-        request.env['dr.search.report']._add_report_entry(kw)
+    def dr_search_report(self, reports=None, **kw):
+        for report_data in (reports or [kw])[:SEARCH_REPORT_LIMIT]:
+            request.env['dr.search.report']._dr_buffer_report_entry(report_data)
         return {}
 
 
@@ -1053,60 +1154,19 @@ class ThemePrimePWA(http.Controller):
 
     @http.route('/pwa/<int:website_id>/manifest.json', type='http', auth='public', website=True)
     def get_pwa_manifest(self, website_id, **kargs):
-        manifest_data = {"fake": 1}
         website = request.website
-        if website and website.id == website_id and website.dr_pwa_activated:
-            manifest_data = {
-                "name": website.dr_pwa_name,
-                "short_name": website.dr_pwa_short_name,
-                "display": "standalone",
-                "background_color": website.dr_pwa_background_color,
-                "theme_color": website.dr_pwa_theme_color,
-                "id": website.dr_pwa_start_url,
-                "start_url": website.dr_pwa_start_url,
-                "scope": "/",
-                "icons": [{
-                    "src": "/web/image/website/%s/dr_pwa_icon_192/192x192" % website.id,
-                    "sizes": "192x192",
-                    "type": "image/png",
-                }, {
-                    "src": "/web/image/website/%s/dr_pwa_icon_512/512x512" % website.id,
-                    "sizes": "512x512",
-                    "type": "image/png",
-                }]
-            }
-            if website.dr_pwa_screenshots:
-                manifest_data['screenshots'] = [{
-                    "src": "/web/image/dr.pwa.screenshots/%s/image" % screenshot.id,
-                    "type": "image/jpg",
-                    "sizes": screenshot.sizes,
-                    "form_factor": screenshot.form_factor,
-                } for screenshot in website.dr_pwa_screenshots]
-            if website.dr_pwa_shortcuts:
-                manifest_data['shortcuts'] = [{
-                    "name": shortcut.name,
-                    "short_name": shortcut.short_name or '',
-                    "description": shortcut.description or '',
-                    "url": shortcut.url,
-                    "icons": [{"src": "/web/image/dr.pwa.shortcuts/%s/icon/192x192" % shortcut.id, "sizes": "192x192"}]
-                } for shortcut in website.dr_pwa_shortcuts]
-        return request.make_response(
-            data=json.dumps(manifest_data),
-            headers=[('Content-Type', 'application/json')]
-        )
+        if website and website.id == website_id:
+            body, etag = website._dr_get_pwa_manifest(website._dr_get_pwa_version_key(), request.env.lang)
+        else:
+            body, etag = json.dumps({"fake": 1}).encode(), False
+        return self._dr_conditional_response(body, etag, 'application/json', 'public, max-age=3600')
 
     @http.route('/service_worker.js', type='http', auth='public', website=True, sitemap=False)
     def get_pwa_service_worker(self, **kargs):
         website = request.website
-        offline_bool = 'true' if website.dr_pwa_offline_page else 'false'
-        data = file_open('theme_prime/static/src/js/pwa/service_worker.js', 'rb').read().decode()
-        data = data.replace('"##1##"', str(website.dr_pwa_version))
-        data = data.replace('"##2##"', offline_bool)
-
-        return request.make_response(
-            data=data,
-            headers=[('Content-Type', 'text/javascript')]
-        )
+        body, etag = website._dr_get_pwa_service_worker(website.dr_pwa_version, bool(website.dr_pwa_offline_page), website._dr_get_pwa_runtime_cache_sizes())
+        # Browsers must always revalidate the service worker to get its updates
+        return self._dr_conditional_response(body, etag, 'text/javascript', 'no-cache')
 
     @http.route('/pwa/offline_page', type='http', auth='public', website=True, cors='*', sitemap=False)
     def get_pwa_offline_page(self, **kargs):
@@ -1116,15 +1176,20 @@ class ThemePrimePWA(http.Controller):
     def get_pwa_logo(self, **kargs):
         website = request.website
         imgname = 'logo'
-        imgext = '.png'
         if not website.logo:
             response = http.Stream.from_path(file_path('web/static/img/nologo.png')).get_response()
         else:
-            image_base64 = base64.b64decode(website.logo)
-            image_data = io.BytesIO(image_base64)
-            mimetype = guess_mimetype(image_base64, default='image/png')
-            imgext = '.' + mimetype.split('/')[1]
-            if imgext == '.svg+xml':
-                imgext = '.svg'
-            response = send_file(image_data, request.httprequest.environ, download_name=imgname + imgext, mimetype=mimetype, last_modified=website.write_date)
+            image_data, etag, mimetype, imgext = website._dr_get_pwa_logo(website.write_date)
+            response = self._dr_conditional_response(image_data, etag, mimetype, 'public, max-age=86400')
+            response.headers['Content-Disposition'] = http.content_disposition(imgname + imgext, 'inline')
         return response
+
+    def _dr_conditional_response(self, body, etag, content_type, cache_control):
+        """ Response with ETag and Cache-Control headers, empty 304 when the client already has this version """
+        headers = [('Content-Type', content_type), ('Cache-Control', cache_control)]
+        if not etag:
+            return request.make_response(body, headers=headers)
+        headers.append(('ETag', etag))
+        if request.httprequest.if_none_match.contains(etag.strip('"')):
+            return request.make_response(b'', headers=headers, status=304)
+        return request.make_response(body, headers=headers)
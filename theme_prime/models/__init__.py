@@ -4,3 +4,12 @@
 from . import theme_prime
 from . import ir_http
 from . import product_template
+from . import product_product
+from . import product_attribute
+from . import product_public_category
+from . import dr_product_label
+from . import rating_rating
+from . import mail_message
+from . import product_pricelist
+from . import website
+from . import dr_search_report
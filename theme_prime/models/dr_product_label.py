@@ -0,0 +1,26 @@
+# -*- coding: utf-8 -*-
+# Copyright (c) 2019-Present Droggol Infotech Private Limited. (<https://www.droggol.com/>)
+
+from odoo import models, api
+
+
+class DrProductLabel(models.Model):
+    _inherit = 'dr.product.label'
+
+    # Category labels are part of the cached category tree and mega menu payloads
+
+    @api.model_create_multi
+    def create(self, vals_list):
+        labels = super().create(vals_list)
+        self.env['website']._dr_bump_cache_version('catalog')
+        return labels
+
+    def write(self, vals):
+        res = super().write(vals)
+        self.env['website']._dr_bump_cache_version('catalog')
+        return res
+
+    def unlink(self):
+        res = super().unlink()
+        self.env['website']._dr_bump_cache_version('catalog')
+        return res
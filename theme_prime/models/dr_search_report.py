@@ -0,0 +1,104 @@
+# -*- coding: utf-8 -*-
+# Copyright (c) 2019-Present Droggol Infotech Private Limited. (<https://www.droggol.com/>)
+
+import functools
+import json
+import logging
+import threading
+import time
+from collections import Counter, defaultdict
+
+from odoo import models, api, SUPERUSER_ID
+from odoo.modules.registry import Registry
+
+_logger = logging.getLogger(__name__)
+
+
+class DrSearchReport(models.Model):
+    _inherit = 'dr.search.report'
+
+    @api.model
+    def _dr_buffer_report_entry(self, report_data):
+        """ Queue the report entry of the current website instead of inserting it in the request transaction.
+            Entries reach the worker buffer once the request is committed (a retried request does not queue them twice).
+            Buffer is written in its own transaction when it is full, or by a timer of the worker once it is max_age
+            old (a quiet website does not wait for the next report).
+        """
+        pending_entries = self.env.cr.postcommit.data.setdefault('dr_search_report_entries', [])
+        if not pending_entries:
+            key = (self.env.cr.dbname, self.env['website'].get_current_website().id)
+            self.env.cr.postcommit.add(functools.partial(_dr_buffer_committed_entries, key, dict(self.env.context), pending_entries))
+        pending_entries.append((self.env.uid, json.dumps(self._dr_prepare_report_vals(report_data), sort_keys=True, default=str)))
+
+    @api.model
+    def _dr_prepare_report_vals(self, report_data):
+        """ Values of a report entry of the current website and user, keys which are not plain fields are ignored """
+        vals = {
+            name: value for name, value in report_data.items()
+            if name in self._fields and name not in models.MAGIC_COLUMNS and not self._fields[name].relational
+        }
+        if 'website_id' in self._fields:
+            vals['website_id'] = self.env['website'].get_current_website().id
+        if 'user_id' in self._fields:
+            vals['user_id'] = self.env.uid
+        return vals
+
+    @api.model
+    def _dr_write_report_entries(self, entries):
+        """ Write aggregated entries with one create per user
+
+            :param entries: Counter {(uid, report vals json): count}
+        """
+        vals_by_uid = defaultdict(list)
+        for (uid, vals), count in entries.items():
+            vals_by_uid[uid] += [json.loads(vals) for __ in range(count)]
+        for uid, vals_list in vals_by_uid.items():
+            self.with_user(uid).sudo().create(vals_list)
+
+
+def _dr_buffer_committed_entries(key, context, entries):
+    if dr_report_buffer.add(key, entries, functools.partial(_dr_flush_report_entries, key, context)):
+        _dr_flush_report_entries(key, context)
+
+
+def _dr_flush_report_entries(key, context):
+    entries = dr_report_buffer.pop(key)
+    if not entries:
+        return
+    try:
+        with Registry(key[0]).cursor() as cr:
+            env = api.Environment(cr, SUPERUSER_ID, {**context, 'website_id': key[1]})
+            env['dr.search.report']._dr_write_report_entries(entries)
+    except Exception:
+        _logger.exception("Failed to write %s buffered search report entries", entries.total())
+
+
+class DrReportBuffer:
+    """ Identical report entries of a (database, website) aggregated in memory until flushed """
+
+    def __init__(self, max_size=50, max_age=60):
+        self.lock = threading.Lock()
+        self.entries = defaultdict(Counter)
+        self.since = {}
+        self.max_size, self.max_age = max_size, max_age
+
+    def add(self, key, entries, flush):
+        """ :param flush: callable flushing the entries of the key, called by a timer when they are max_age old
+            :return: True if the caller must flush the entries of the key
+        """
+        with self.lock:
+            self.entries[key].update(entries)
+            if key not in self.since:
+                self.since[key] = time.monotonic()
+                timer = threading.Timer(self.max_age, flush)
+                timer.daemon = True
+                timer.start()
+            return self.entries[key].total() >= self.max_size or time.monotonic() - self.since[key] >= self.max_age
+
+    def pop(self, key):
+        with self.lock:
+            self.since.pop(key, None)
+            return self.entries.pop(key, Counter())
+
+
+dr_report_buffer = DrReportBuffer()
@@ -1,7 +1,10 @@
 # -*- coding: utf-8 -*-
 # Copyright (c) 2019-Present Droggol Infotech Private Limited. (<https://www.droggol.com/>)
 
+import hashlib
+
 from odoo import models
+from odoo.http import request
 
 
 class IrHttp(models.AbstractModel):
@@ -11,3 +14,19 @@ class IrHttp(models.AbstractModel):
     def _get_translation_frontend_modules_name(cls):
         mods = super(IrHttp, cls)._get_translation_frontend_modules_name()
         return mods + ['droggol_theme_common', 'theme_prime']
+
+    @classmethod
+    def _post_dispatch(cls, response):
+        super()._post_dispatch(response)
+        website = getattr(request, 'is_frontend', False) and getattr(request, 'website', False)
+        if website and response.mimetype == 'text/html':
+            response.headers['X-Dr-Session-State'] = cls._dr_get_page_session_state(website)
+
+    @classmethod
+    def _dr_get_page_session_state(cls, website):
+        """ Session state of the website pages for the PWA page cache, the service worker drops its cached pages when it changes.
+            'private' (not cacheable) when pages are specific to the visitor: logged in user or cart.
+        """
+        if not request.env.user._is_public() or request.session.get('sale_order_id'):
+            return 'private'
+        return hashlib.sha1(str((website.id, website.pricelist_id.id, website.fiscal_position_id.id)).encode()).hexdigest()[:16]
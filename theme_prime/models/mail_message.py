@@ -0,0 +1,26 @@
+# -*- coding: utf-8 -*-
+# Copyright (c) 2019-Present Droggol Infotech Private Limited. (<https://www.droggol.com/>)
+
+from odoo import models
+
+
+class MailMessage(models.Model):
+    _inherit = 'mail.message'
+
+    def write(self, vals):
+        # is_internal of the ratings is related to the message, its recompute does not go through rating.rating write
+        if 'is_internal' not in vals:
+            return super().write(vals)
+        res = super().write(vals)
+        self._dr_ratings()._dr_rated_products()._dr_update_rating_summary()
+        return res
+
+    def unlink(self):
+        # Ratings of the messages are deleted by the database (ondelete cascade), not by rating.rating unlink
+        products = self._dr_ratings()._dr_rated_products()
+        res = super().unlink()
+        products._dr_update_rating_summary()
+        return res
+
+    def _dr_ratings(self):
+        return self.env['rating.rating'].sudo().search([('message_id', 'in', self.ids), ('res_model', '=', 'product.template')])
@@ -0,0 +1,77 @@
+# -*- coding: utf-8 -*-
+# Copyright (c) 2019-Present Droggol Infotech Private Limited. (<https://www.droggol.com/>)
+
+from odoo import models, api
+
+
+class ProductAttribute(models.Model):
+    _inherit = 'product.attribute'
+
+    @api.model_create_multi
+    def create(self, vals_list):
+        attributes = super().create(vals_list)
+        self.env['website']._dr_bump_cache_version('search_index')
+        return attributes
+
+    def write(self, vals):
+        res = super().write(vals)
+        self.env['website']._dr_bump_cache_version('search_index', 'search_attributes')
+        return res
+
+    def unlink(self):
+        res = super().unlink()
+        self.env['website']._dr_bump_cache_version('search_index', 'search_attributes')
+        return res
+
+
+class ProductAttributeValue(models.Model):
+    _inherit = 'product.attribute.value'
+
+    @api.model_create_multi
+    def create(self, vals_list):
+        values = super().create(vals_list)
+        self.env['website']._dr_bump_cache_version('search_index')
+        self.env['website']._dr_add_search_vocabulary([vals.get('name') for vals in vals_list])
+        return values
+
+    def write(self, vals):
+        res = super().write(vals)
+        self.env['website']._dr_bump_cache_version('search_index')
+        if 'name' in vals:
+            self.env['website']._dr_add_search_vocabulary([vals['name']])
+        return res
+
+    def unlink(self):
+        res = super().unlink()
+        self.env['website']._dr_bump_cache_version('search_index')
+        return res
+
+
+class ProductTemplateAttributeLine(models.Model):
+    _inherit = 'product.template.attribute.line'
+
+    @api.model_create_multi
+    def create(self, vals_list):
+        lines = super().create(vals_list)
+        self.env['website']._dr_bump_cache_version('search_attributes')
+        lines._dr_mark_category_value_index_pending()
+        return lines
+
+    def write(self, vals):
+        if 'product_tmpl_id' in vals:
+            self._dr_mark_category_value_index_pending()
+        res = super().write(vals)
+        if {'attribute_id', 'product_tmpl_id', 'active'} & vals.keys():
+            self.env['website']._dr_bump_cache_version('search_attributes')
+        if {'product_tmpl_id', 'value_ids', 'active'} & vals.keys():
+            self._dr_mark_category_value_index_pending()
+        return res
+
+    def unlink(self):
+        self._dr_mark_category_value_index_pending()
+        res = super().unlink()
+        self.env['website']._dr_bump_cache_version('search_attributes')
+        return res
+
+    def _dr_mark_category_value_index_pending(self):
+        self.sudo().product_tmpl_id.public_categ_ids._dr_mark_category_value_index_pending()
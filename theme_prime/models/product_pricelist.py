@@ -0,0 +1,40 @@
+# -*- coding: utf-8 -*-
+# Copyright (c) 2019-Present Droggol Infotech Private Limited. (<https://www.droggol.com/>)
+
+from odoo import models, api
+
+
+class ProductPricelist(models.Model):
+    _inherit = 'product.pricelist'
+
+    def write(self, vals):
+        res = super().write(vals)
+        if {'currency_id', 'company_id', 'active'} & set(vals):
+            self.env['product.template']._dr_invalidate_discount_index(self.ids)
+            self.env['website']._dr_bump_cache_version('search_results', 'pricelist')
+        return res
+
+
+class ProductPricelistItem(models.Model):
+    _inherit = 'product.pricelist.item'
+
+    @api.model_create_multi
+    def create(self, vals_list):
+        items = super().create(vals_list)
+        self.env['product.template']._dr_invalidate_discount_index(items.pricelist_id.ids)
+        self.env['website']._dr_bump_cache_version('search_results', 'pricelist')
+        return items
+
+    def write(self, vals):
+        pricelist_ids = self.pricelist_id.ids
+        res = super().write(vals)
+        self.env['product.template']._dr_invalidate_discount_index(set(pricelist_ids + self.pricelist_id.ids))
+        self.env['website']._dr_bump_cache_version('search_results', 'pricelist')
+        return res
+
+    def unlink(self):
+        pricelist_ids = self.pricelist_id.ids
+        res = super().unlink()
+        self.env['product.template']._dr_invalidate_discount_index(pricelist_ids)
+        self.env['website']._dr_bump_cache_version('search_results', 'pricelist')
+        return res
@@ -0,0 +1,21 @@
+# -*- coding: utf-8 -*-
+# Copyright (c) 2019-Present Droggol Infotech Private Limited. (<https://www.droggol.com/>)
+
+from odoo import models, api
+
+
+class ProductProduct(models.Model):
+    _inherit = 'product.product'
+
+    @api.model_create_multi
+    def create(self, vals_list):
+        products = super().create(vals_list)
+        if any(vals.get('default_code') for vals in vals_list):
+            products.product_tmpl_id._dr_update_search_documents()
+        return products
+
+    def write(self, vals):
+        res = super().write(vals)
+        if {'default_code', 'active'} & set(vals):
+            self.product_tmpl_id._dr_update_search_documents()
+        return res
@@ -0,0 +1,201 @@
+# -*- coding: utf-8 -*-
+# Copyright (c) 2019-Present Droggol Infotech Private Limited. (<https://www.droggol.com/>)
+
+from odoo.tools import SQL
+from odoo import models, api
+
+# Index versions whose rebuild was already requested by this worker, per database
+_dr_requested_rebuilds = {}
+
+
+class ProductPublicCategory(models.Model):
+    _inherit = 'product.public.category'
+
+    def init(self):
+        """ Closure table (ancestor, descendant) of public categories.
+            Every category is its own ancestor so a single join rolls product counts up the tree.
+        """
+        self.env.cr.execute("""
+            CREATE TABLE IF NOT EXISTS dr_product_public_category_closure (
+                ancestor_id INTEGER NOT NULL REFERENCES product_public_category(id) ON DELETE CASCADE,
+                descendant_id INTEGER NOT NULL REFERENCES product_public_category(id) ON DELETE CASCADE,
+                PRIMARY KEY (descendant_id, ancestor_id)
+            );
+            CREATE INDEX IF NOT EXISTS dr_product_public_category_closure_ancestor_idx ON dr_product_public_category_closure (ancestor_id);
+        """)
+        self.env.cr.execute("DELETE FROM dr_product_public_category_closure")
+        self.env.cr.execute("""
+            INSERT INTO dr_product_public_category_closure (ancestor_id, descendant_id)
+            SELECT unnest(string_to_array(rtrim(parent_path, '/'), '/'))::int, id FROM product_public_category WHERE parent_path IS NOT NULL
+        """)
+
+        # Attribute values of the published products rolled up to every ancestor category (search suggestions).
+        # website_id is the website of the product, NULL for products published on all websites.
+        self.env.cr.execute("""
+            CREATE TABLE IF NOT EXISTS dr_product_category_value_index (
+                category_id INTEGER NOT NULL REFERENCES product_public_category(id) ON DELETE CASCADE,
+                value_id INTEGER NOT NULL REFERENCES product_attribute_value(id) ON DELETE CASCADE,
+                website_id INTEGER REFERENCES website(id) ON DELETE CASCADE,
+                product_count INTEGER NOT NULL,
+                direct_count INTEGER NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS dr_product_category_value_index_category_idx ON dr_product_category_value_index (category_id);
+            CREATE INDEX IF NOT EXISTS dr_product_category_value_index_value_idx ON dr_product_category_value_index (value_id);
+            CREATE TABLE IF NOT EXISTS dr_product_category_value_index_state (
+                id INTEGER PRIMARY KEY,
+                catalog_version INTEGER NOT NULL,
+                attribute_version INTEGER NOT NULL
+            );
+            CREATE TABLE IF NOT EXISTS dr_product_category_value_index_pending (
+                category_id INTEGER PRIMARY KEY REFERENCES product_public_category(id) ON DELETE CASCADE
+            );
+            DELETE FROM dr_product_category_value_index_state;
+        """)
+
+    @api.model_create_multi
+    def create(self, vals_list):
+        categories = super().create(vals_list)
+        categories._dr_update_category_closure()
+        self.env['website']._dr_bump_cache_version('catalog')
+        self.env['website']._dr_add_search_vocabulary([vals.get('name') for vals in vals_list])
+        return categories
+
+    def write(self, vals):
+        if 'parent_id' in vals:
+            # Products of the subtree leave the index rows of the previous ancestors
+            self._dr_mark_category_value_index_pending()
+        res = super().write(vals)
+        if 'parent_id' in vals:
+            self._dr_update_category_closure()
+            self._dr_mark_category_value_index_pending()
+        if 'name' in vals:
+            self.env['website']._dr_add_search_vocabulary([vals['name']])
+        self.env['website']._dr_bump_cache_version('catalog')
+        return res
+
+    def unlink(self):
+        self._dr_mark_category_value_index_pending()
+        res = super().unlink()
+        self.env['website']._dr_bump_cache_version('catalog')
+        return res
+
+    def _dr_update_category_closure(self):
+        """ Rebuild closure rows of the whole subtree of the categories (path of children changes with parent).
+            Rows of deleted categories are removed by the foreign keys.
+        """
+        if not self:
+            return
+        self.flush_model(['parent_path'])
+        path_patterns = [category.parent_path + '%' for category in self if category.parent_path]
+        if not path_patterns:
+            return
+        self.env.cr.execute(SQL(
+            """
+                DELETE FROM dr_product_public_category_closure
+                WHERE descendant_id IN (SELECT id FROM product_public_category WHERE parent_path LIKE ANY(%(patterns)s));
+
+                INSERT INTO dr_product_public_category_closure (ancestor_id, descendant_id)
+                SELECT unnest(string_to_array(rtrim(parent_path, '/'), '/'))::int, id FROM product_public_category WHERE parent_path LIKE ANY(%(patterns)s);
+            """,
+            patterns=path_patterns,
+        ))
+
+    # ----------------------------------------------------------
+    # Category <-> attribute value index
+    # ----------------------------------------------------------
+
+    def _dr_get_category_value_index_versions(self):
+        return self.env['website']._dr_get_cache_versions(['catalog', 'search_attributes'])
+
+    @api.model
+    def _dr_ensure_category_value_index(self):
+        """ Searches read the last built index, a stale index is rebuilt by the cron (triggered once per version by each worker) """
+        versions = self._dr_get_category_value_index_versions()
+        if _dr_requested_rebuilds.get(self.env.cr.dbname) == versions:
+            return
+        self.env.cr.execute("SELECT catalog_version, attribute_version FROM dr_product_category_value_index_state")
+        if self.env.cr.fetchone() != versions:
+            self.env.ref('theme_prime.ir_cron_dr_category_value_index').sudo()._trigger()
+        _dr_requested_rebuilds[self.env.cr.dbname] = versions
+
+    def _dr_mark_category_value_index_pending(self):
+        """ Queue the categories and their ancestors, their index rows are rebuilt by the next run of the cron """
+        if not self:
+            return
+        self.env.cr.execute("""
+            INSERT INTO dr_product_category_value_index_pending (category_id)
+            SELECT DISTINCT ancestor_id FROM dr_product_public_category_closure WHERE descendant_id = ANY(%s)
+            ON CONFLICT DO NOTHING
+        """, (self.ids,))
+        self.env.ref('theme_prime.ir_cron_dr_category_value_index').sudo()._trigger()
+
+    @api.model
+    def _cron_dr_rebuild_category_value_index(self):
+        """ Rebuild the index rows of the pending categories (whole index when it was never built) """
+        versions = self._dr_get_category_value_index_versions()
+        self.env.cr.execute("SELECT catalog_version, attribute_version FROM dr_product_category_value_index_state")
+        full_rebuild = not self.env.cr.fetchone()
+        for model_name in ['product.template', 'product.template.attribute.line', 'product.public.category']:
+            self.env[model_name].flush_model()
+        self.env.cr.execute("""
+            INSERT INTO dr_product_category_value_index_state (id, catalog_version, attribute_version) VALUES (1, %s, %s)
+            ON CONFLICT (id) DO UPDATE SET catalog_version = EXCLUDED.catalog_version, attribute_version = EXCLUDED.attribute_version
+        """, versions)
+        self.env.cr.execute("DELETE FROM dr_product_category_value_index_pending RETURNING category_id")
+        category_ids = [row[0] for row in self.env.cr.fetchall()]
+        if full_rebuild:
+            self.env.cr.execute("DELETE FROM dr_product_category_value_index")
+            category_filter = SQL("TRUE")
+        elif category_ids:
+            self.env.cr.execute("DELETE FROM dr_product_category_value_index WHERE category_id = ANY(%s)", (category_ids,))
+            category_filter = SQL("closure.ancestor_id = ANY(%s)", category_ids)
+        else:
+            return
+        self.env.cr.execute(SQL(
+            """
+                INSERT INTO dr_product_category_value_index (category_id, value_id, website_id, product_count, direct_count)
+                SELECT closure.ancestor_id, value_rel.product_attribute_value_id, product.website_id,
+                       count(DISTINCT product.id), count(DISTINCT product.id) FILTER (WHERE closure.ancestor_id = closure.descendant_id)
+                FROM product_template AS product
+                    JOIN product_public_category_product_template_rel AS categ_rel ON categ_rel.product_template_id = product.id
+                    JOIN dr_product_public_category_closure AS closure ON closure.descendant_id = categ_rel.product_public_category_id
+                    JOIN product_template_attribute_line AS line ON line.product_tmpl_id = product.id AND line.active
+                    JOIN product_attribute_value_product_template_attribute_line_rel AS value_rel ON value_rel.product_template_attribute_line_id = line.id
+                WHERE product.active AND product.sale_ok AND product.is_published AND %s
+                GROUP BY closure.ancestor_id, value_rel.product_attribute_value_id, product.website_id
+            """,
+            category_filter,
+        ))
+
+    @api.model
+    def _dr_get_category_value_ids(self, website, category_id, search_type):
+        """ Attribute values of the products of the category and its children, values of the category itself first, then by product count
+
+            :param search_type: list of dr_search_suggestion of the attributes
+        """
+        self._dr_ensure_category_value_index()
+        self.env.cr.execute("""
+            SELECT value_index.value_id
+            FROM dr_product_category_value_index AS value_index
+                JOIN product_attribute_value AS value ON value.id = value_index.value_id
+                JOIN product_attribute AS attribute ON attribute.id = value.attribute_id
+            WHERE value_index.category_id = %s AND (value_index.website_id IS NULL OR value_index.website_id = %s) AND attribute.dr_search_suggestion IN %s
+            GROUP BY value_index.value_id
+            ORDER BY sum(value_index.direct_count) > 0 DESC, sum(value_index.product_count) DESC, value_index.value_id
+        """, (category_id, website.id, tuple(search_type)))
+        return [row[0] for row in self.env.cr.fetchall()]
+
+    @api.model
+    def _dr_get_value_category_ids(self, website, value_id):
+        """ Website categories directly holding products with the attribute value, by product count """
+        self._dr_ensure_category_value_index()
+        self.env.cr.execute("""
+            SELECT value_index.category_id
+            FROM dr_product_category_value_index AS value_index
+                JOIN product_public_category AS category ON category.id = value_index.category_id
+            WHERE value_index.value_id = %s AND value_index.direct_count > 0
+                AND (value_index.website_id IS NULL OR value_index.website_id = %s) AND (category.website_id IS NULL OR category.website_id = %s)
+            GROUP BY value_index.category_id
+            ORDER BY sum(value_index.direct_count) DESC, value_index.category_id
+        """, (value_id, website.id, website.id))
+        return [row[0] for row in self.env.cr.fetchall()]
@@ -1,215 +1,765 @@
 # -*- coding: utf-8 -*-
 # Copyright (c) 2019-Present Droggol Infotech Private Limited. (<https://www.droggol.com/>)
 
-from odoo.tools import SQL
+import base64
+import datetime
+import io
+import logging
+import re
+
+from PIL import features as pil_features
+
+from odoo.tools import SQL, str2bool
+from odoo.tools.image import ImageProcess
+from odoo.tools.query import Query
+from odoo.osv import expression
 from odoo import models, fields, api, tools
 
+# Modern formats the product images are derived to, best first (AVIF needs a Pillow built with libavif)
+DR_IMAGE_DERIVATIVE_FORMATS = [fmt for fmt in ['avif', 'webp'] if fmt in pil_features.modules and pil_features.check_module(fmt)]
+DR_IMAGE_DERIVATIVE_SIZES = [1024, 512, 256]
+
+_logger = logging.getLogger(__name__)
+
 
 class ProductTemplate(models.Model):
     _inherit = 'product.template'
 
     dr_has_discount = fields.Boolean(compute="_compute_dr_has_discount", search="_search_dr_has_discount")
 
+    # Rating summary of published ratings, maintained by rating.rating (see _dr_update_rating_summary)
+    dr_rating_avg = fields.Float(readonly=True, copy=False)
+    dr_rating_count = fields.Integer(readonly=True, copy=False)
+    dr_rating_bucket = fields.Integer(readonly=True, copy=False, index=True, help="Floored average rating used by shop rating filter.")
+
+    def init(self):
+        self._dr_update_rating_summary(all_products=True)
+        self._dr_init_discount_index()
+        self._dr_init_bestseller_ranking()
+        self._dr_init_search_documents()
+        self._dr_init_image_derivatives()
+
+    @api.model_create_multi
+    def create(self, vals_list):
+        products = super().create(vals_list)
+        products._dr_mark_discount_index_pending()
+        products._dr_update_search_documents()
+        products.sudo().public_categ_ids._dr_mark_category_value_index_pending()
+        self.env['website']._dr_bump_cache_version('catalog')
+        self.env['website']._dr_add_search_vocabulary([vals.get('name') for vals in vals_list])
+        if any(vals.get('image_1920') for vals in vals_list):
+            products._dr_mark_image_derivatives_pending()
+        return products
+
+    def write(self, vals):
+        category_value_index_changed = bool(self._dr_category_value_index_fields() & set(vals))
+        if category_value_index_changed:
+            # Categories the products leave
+            self.sudo().public_categ_ids._dr_mark_category_value_index_pending()
+        res = super().write(vals)
+        if category_value_index_changed:
+            self.sudo().public_categ_ids._dr_mark_category_value_index_pending()
+        if self._dr_discount_index_fields() & set(vals):
+            self._dr_mark_discount_index_pending()
+        if self._dr_catalog_fields() & set(vals):
+            self.env['website']._dr_bump_cache_version('catalog')
+        elif self._dr_search_fields() & set(vals):
+            self.env['website']._dr_bump_cache_version('search_results')
+        if 'website_sequence' in vals:
+            self.env['website']._dr_bump_cache_version('product_nav')
+        if 'name' in vals:
+            self.env['website']._dr_add_search_vocabulary([vals['name']])
+        if {'name', 'default_code', 'description', 'description_sale'} & set(vals):
+            self._dr_update_search_documents()
+        if 'image_1920' in vals:
+            self._dr_mark_image_derivatives_pending()
+        return res
+
+    def unlink(self):
+        self.sudo().public_categ_ids._dr_mark_category_value_index_pending()
+        res = super().unlink()
+        self.env['website']._dr_bump_cache_version('catalog')
+        return res
+
+    def _dr_category_value_index_fields(self):
+        """ Fields changing the rows of the products in the category attribute value index """
+        return {'public_categ_ids', 'active', 'sale_ok', 'is_published', 'website_published', 'website_id'}
+
+    def _dr_discount_index_fields(self):
+        return {'list_price', 'compare_list_price', 'categ_id', 'sale_ok', 'active', 'is_published', 'website_published', 'website_id', 'company_id', 'taxes_id'}
+
+    def _dr_catalog_fields(self):
+        """ Fields changing what the website catalog shows, their write invalidates the 'catalog' caches """
+        return {'public_categ_ids', 'sale_ok', 'active', 'is_published', 'website_published', 'website_id', 'company_id'}
+
+    def _dr_search_fields(self):
+        """ Fields shown or searched by the search autocomplete, their write invalidates the cached search results """
+        return {'name', 'default_code', 'description', 'description_sale', 'list_price', 'compare_list_price', 'taxes_id', 'website_sequence', 'image_1920', 'dr_label_id'}
+
+    def _dr_update_rating_summary(self, all_products=False):
+        """ Refresh the rating summary of the products from their published ratings """
+        if not self and not all_products:
+            return
+        self.env['rating.rating'].flush_model(['res_model', 'res_id', 'rating', 'is_internal'])
+        product_filter = SQL("TRUE") if all_products else SQL("product_template.id IN %s", tuple(self.ids))
+        rating_filter = SQL("TRUE") if all_products else SQL("res_id IN %s", tuple(self.ids))
+        self.env.cr.execute(SQL(
+            """
+                UPDATE product_template
+                SET dr_rating_avg = COALESCE(summary.rating_avg, 0),
+                    dr_rating_count = COALESCE(summary.rating_count, 0),
+                    dr_rating_bucket = COALESCE(FLOOR(summary.rating_avg), 0)
+                FROM product_template AS template
+                LEFT JOIN (
+                    SELECT res_id, avg(rating) AS rating_avg, count(*) AS rating_count
+                    FROM rating_rating
+                    WHERE res_model = 'product.template' AND is_internal = False AND %(rating_filter)s
+                    GROUP BY res_id
+                ) AS summary ON summary.res_id = template.id
+                WHERE template.id = product_template.id AND %(product_filter)s
+            """,
+            product_filter=product_filter,
+            rating_filter=rating_filter,
+        ))
+        self.invalidate_model(['dr_rating_avg', 'dr_rating_count', 'dr_rating_bucket'])
+
     def _search_dr_has_discount(self, operator, value):
         pricelist_id = self._context.get('pricelist')
         if pricelist_id:
-            discounted_product_ids = self._get_product_pricelist_data(pricelist_id)
+            website = self.env['website'].get_current_website()
+            self._dr_ensure_discount_index(website, pricelist_id)
+            discount_index = Query(self.env, 'discount_index', SQL(
+                "(SELECT product_tmpl_id AS id FROM dr_product_discount_index WHERE website_id = %s AND pricelist_id = %s)",
+                website.id, pricelist_id,
+            ))
             operator = 'in' if operator == '!=' else 'not in'
-            return [('id', operator, discounted_product_ids)]
+            return [('id', operator, discount_index)]
         return []
 
-    def _need_catch_update(self, pricelist_id, catch_date):
-        catch_date_obj = fields.Datetime.to_datetime(catch_date)
-        item_ids_catch = self._pricelist_items_for_date(pricelist_id, catch_date)
-        item_ids_now = self._pricelist_items_for_date(pricelist_id, fields.Datetime.to_string(fields.Datetime.now()))
-        if set(item_ids_catch) != set(item_ids_now):
-            return True
-
-        if self.env['product.pricelist'].browse(pricelist_id).write_date > catch_date_obj:
-            return True
+    def _get_product_pricelist_data(self, pricelist_id):
+        website = self.env['website'].get_current_website()
+        self._dr_ensure_discount_index(website, pricelist_id)
+        self.env.cr.execute("SELECT product_tmpl_id FROM dr_product_discount_index WHERE website_id = %s AND pricelist_id = %s", (website.id, pricelist_id))
+        return [x[0] for x in self.env.cr.fetchall()]
 
-        product_grouped_data = self.env['product.template'].read_group([('sale_ok', '=', True)], ['write_date:max'], ['sale_ok'])
-        if product_grouped_data:
-            product_date = product_grouped_data[0].get('write_date')
-            if product_date > catch_date_obj:
-                return True
-        return False
+    # ----------------------------------------------------------
+    # Discount index
+    # ----------------------------------------------------------
+    # dr_product_discount_index: discounted products per (website, pricelist)
+    # dr_product_discount_index_state: built indexes, valid until the next date_start/date_end of the pricelist rules
+    # dr_product_discount_index_pending: products changed since the index was built
+
+    def _dr_init_discount_index(self):
+        self.env.cr.execute("""
+            CREATE TABLE IF NOT EXISTS dr_product_discount_index (
+                website_id INTEGER NOT NULL REFERENCES website(id) ON DELETE CASCADE,
+                pricelist_id INTEGER NOT NULL REFERENCES product_pricelist(id) ON DELETE CASCADE,
+                product_tmpl_id INTEGER NOT NULL REFERENCES product_template(id) ON DELETE CASCADE,
+                PRIMARY KEY (website_id, pricelist_id, product_tmpl_id)
+            );
+            CREATE TABLE IF NOT EXISTS dr_product_discount_index_state (
+                website_id INTEGER NOT NULL REFERENCES website(id) ON DELETE CASCADE,
+                pricelist_id INTEGER NOT NULL REFERENCES product_pricelist(id) ON DELETE CASCADE,
+                valid_until TIMESTAMP,
+                PRIMARY KEY (website_id, pricelist_id)
+            );
+            CREATE TABLE IF NOT EXISTS dr_product_discount_index_pending (
+                website_id INTEGER NOT NULL REFERENCES website(id) ON DELETE CASCADE,
+                pricelist_id INTEGER NOT NULL REFERENCES product_pricelist(id) ON DELETE CASCADE,
+                product_tmpl_id INTEGER NOT NULL REFERENCES product_template(id) ON DELETE CASCADE,
+                PRIMARY KEY (website_id, pricelist_id, product_tmpl_id)
+            );
+            DELETE FROM dr_product_discount_index_state;
+        """)
 
     @api.model
-    def _pricelist_items_for_date(self, pricelist_id, date):
+    def _dr_ensure_discount_index(self, website, pricelist_id):
+        """ Build the discount index of the website pricelist if missing or expired, else refresh the changed products only """
         self.env.cr.execute(
-            """ SELECT item.id FROM product_pricelist_item AS item
-                WHERE (item.pricelist_id = %s) AND (item.date_start IS NULL OR item.date_start<=%s) AND (item.date_end IS NULL OR item.date_end>=%s)
-            """, (pricelist_id, date, date))
-        return [x[0] for x in self.env.cr.fetchall()]
+            "SELECT valid_until FROM dr_product_discount_index_state WHERE website_id = %s AND pricelist_id = %s",
+            (website.id, pricelist_id))
+        state = self.env.cr.fetchone()
+        if not state or (state[0] and state[0] <= fields.Datetime.now()):
+            self._dr_build_discount_index(website, pricelist_id)
+            return
 
-    def _get_product_pricelist_data(self, pricelist_id):
-        discounted_product_ids, catch_date = self._get_product_pricelist_cache(pricelist_id)
-        need_catch_update = self._need_catch_update(pricelist_id, catch_date)
-        if need_catch_update:
-            self.clear_caches()
-            discounted_product_ids, catch_date = self._get_product_pricelist_cache(pricelist_id)
-        return discounted_product_ids
-
-    @tools.ormcache('pricelist_id')
-    def _get_product_pricelist_cache(self, pricelist_id):
-        website = self.env['website'].get_current_website()
+        self.env.cr.execute(
+            "DELETE FROM dr_product_discount_index_pending WHERE website_id = %s AND pricelist_id = %s RETURNING product_tmpl_id",
+            (website.id, pricelist_id))
+        pending_ids = [x[0] for x in self.env.cr.fetchall()]
+        if pending_ids:
+            self.env.cr.execute(
+                "DELETE FROM dr_product_discount_index WHERE website_id = %s AND pricelist_id = %s AND product_tmpl_id IN %s",
+                (website.id, pricelist_id, tuple(pending_ids)))
+            products = self.sudo().search(expression.AND([website.sale_product_domain(), [('id', 'in', pending_ids)]]))
+            self._dr_insert_discounted_products(website, pricelist_id, products)
+
+    @api.model
+    def _dr_build_discount_index(self, website, pricelist_id):
+        now = fields.Datetime.now()
+        self.env.cr.execute("DELETE FROM dr_product_discount_index WHERE website_id = %s AND pricelist_id = %s", (website.id, pricelist_id))
         products = self.sudo().search(website.sale_product_domain())    # Need sudo so all products are calculated
-        discounted_product_ids = []
-        all_products_prices = products._get_sales_prices(website)
-        for p_id, price_data in all_products_prices.items():
-            if price_data.get('base_price'):
-                discounted_product_ids.append(p_id)
-        return discounted_product_ids, fields.Datetime.to_string(fields.Datetime.now())
+        self._dr_insert_discounted_products(website, pricelist_id, products)
+
+        # Next rule start or end of the pricelist (and the pricelists it is based on) expires the index
+        self.env.cr.execute("""
+            WITH RECURSIVE pricelists AS (
+                SELECT %(pricelist_id)s AS id
+                UNION
+                SELECT item.base_pricelist_id FROM product_pricelist_item AS item JOIN pricelists ON item.pricelist_id = pricelists.id
+                WHERE item.base_pricelist_id IS NOT NULL
+            )
+            SELECT LEAST(min(item.date_start) FILTER (WHERE item.date_start > %(now)s), min(item.date_end) FILTER (WHERE item.date_end >= %(now)s))
+            FROM product_pricelist_item AS item WHERE item.pricelist_id IN (SELECT id FROM pricelists)
+        """, {'pricelist_id': pricelist_id, 'now': now})
+        valid_until = self.env.cr.fetchone()[0]
+        self.env.cr.execute("""
+            DELETE FROM dr_product_discount_index_pending WHERE website_id = %(website_id)s AND pricelist_id = %(pricelist_id)s;
+            INSERT INTO dr_product_discount_index_state (website_id, pricelist_id, valid_until) VALUES (%(website_id)s, %(pricelist_id)s, %(valid_until)s)
+            ON CONFLICT (website_id, pricelist_id) DO UPDATE SET valid_until = EXCLUDED.valid_until;
+        """, {'website_id': website.id, 'pricelist_id': pricelist_id, 'valid_until': valid_until})
 
-    def _dr_process_product_data(self, product_pricelist_data, product):
-        return {'display_name': product_pricelist_data['display_name'], 'price': product_pricelist_data['price'], 'id': product_pricelist_data['product_template_id']}
+    @api.model
+    def _dr_insert_discounted_products(self, website, pricelist_id, products):
+        discounted_product_ids = [p_id for p_id, price_data in products._get_sales_prices(website).items() if price_data.get('base_price')]
+        if discounted_product_ids:
+            self.env.cr.execute("""
+                INSERT INTO dr_product_discount_index (website_id, pricelist_id, product_tmpl_id)
+                SELECT %s, %s, unnest(%s::int[]) ON CONFLICT DO NOTHING
+            """, (website.id, pricelist_id, discounted_product_ids))
 
-    def _compute_dr_has_discount(self):
-        for product in self:
-            product.dr_has_discount = False
+    @api.model
+    def _dr_invalidate_discount_index(self, pricelist_ids):
+        """ Drop the discount index of the pricelists and of all the pricelists based on them """
+        if not pricelist_ids:
+            return
+        self.env.cr.execute("""
+            WITH RECURSIVE pricelists AS (
+                SELECT unnest(%s::int[]) AS id
+                UNION
+                SELECT item.pricelist_id FROM product_pricelist_item AS item JOIN pricelists ON item.base_pricelist_id = pricelists.id
+            )
+            DELETE FROM dr_product_discount_index_state WHERE pricelist_id IN (SELECT id FROM pricelists)
+        """, (list(pricelist_ids),))
+
+    def _dr_mark_discount_index_pending(self):
+        """ Products are recomputed in every built discount index on their next use """
+        if self:
+            self.env.cr.execute("""
+                INSERT INTO dr_product_discount_index_pending (website_id, pricelist_id, product_tmpl_id)
+                SELECT state.website_id, state.pricelist_id, product.id
+                FROM dr_product_discount_index_state AS state CROSS JOIN unnest(%s::int[]) AS product(id)
+                ON CONFLICT DO NOTHING
+            """, (self.ids,))
 
-    def _get_product_category_count(self, domain=[]):
-        from_clause, where_clause = self._dr_prepare_query_parts(domain)
-        query = SQL(
-            """
-                SELECT
-                    count(product_template.id),
-                    product_public_category.parent_path as path,
-                    product_public_category.parent_id as parent_id,
-                    product_public_category.id as product_public_category_id
-                FROM product_public_category_product_template_rel
-                    JOIN product_template ON product_template.id = product_public_category_product_template_rel.product_template_id
-                    %(from_clause)s
-                    JOIN product_public_category ON product_public_category.id = product_public_category_product_template_rel.product_public_category_id
-                WHERE %(where_clause)s
-                GROUP BY product_public_category.id;
-            """,
-            from_clause=from_clause,
-            where_clause=where_clause,
-        )
+    @api.model
+    def _cron_dr_discount_index(self):
+        """ Expire the discount indexes that crossed a pricelist rule date boundary """
+        self.env.cr.execute("DELETE FROM dr_product_discount_index_state WHERE valid_until <= %s", (fields.Datetime.now(),))
+
+    # ----------------------------------------------------------
+    # Full text search documents
+    # ----------------------------------------------------------
+    # dr_product_search_document: weighted full text documents of the products per language,
+    # document_name (name A, internal references A) and document (+ sales description B, description C)
+
+    def _dr_init_search_documents(self):
+        self.env.cr.execute("""
+            CREATE TABLE IF NOT EXISTS dr_product_search_document (
+                product_tmpl_id INTEGER NOT NULL REFERENCES product_template(id) ON DELETE CASCADE,
+                lang VARCHAR NOT NULL,
+                document_name TSVECTOR NOT NULL,
+                document TSVECTOR NOT NULL,
+                PRIMARY KEY (product_tmpl_id, lang)
+            );
+            CREATE INDEX IF NOT EXISTS dr_product_search_document_name_idx ON dr_product_search_document USING gin (document_name);
+            CREATE INDEX IF NOT EXISTS dr_product_search_document_idx ON dr_product_search_document USING gin (document);
+        """)
+        self.with_context(active_test=False).search([])._dr_update_search_documents()
+
+    def _dr_update_search_documents(self):
+        """ Rebuild the search documents of the products in all the active languages """
+        if not self:
+            return
+        self.flush_model(['name', 'description', 'description_sale'])
+        self.env['product.product'].flush_model(['default_code', 'product_tmpl_id', 'active'])
+        self.env.cr.execute("""
+            DELETE FROM dr_product_search_document WHERE product_tmpl_id = ANY(%(ids)s);
+
+            INSERT INTO dr_product_search_document (product_tmpl_id, lang, document_name, document)
+            SELECT product.id, lang.code, product.document_name, product.document_name
+                || setweight(to_tsvector('simple', coalesce(product.description_sale->>lang.code, product.description_sale->>'en_US', '')), 'B')
+                || setweight(to_tsvector('simple', coalesce(product.description->>lang.code, product.description->>'en_US', '')), 'C')
+            FROM res_lang AS lang
+                CROSS JOIN LATERAL (
+                    SELECT product_template.id, product_template.description, product_template.description_sale,
+                           setweight(to_tsvector('simple', coalesce(product_template.name->>lang.code, product_template.name->>'en_US', '')), 'A')
+                           || setweight(to_tsvector('simple', coalesce(string_agg(product_product.default_code, ' '), '')), 'A') AS document_name
+                    FROM product_template
+                        LEFT JOIN product_product ON product_product.product_tmpl_id = product_template.id AND product_product.active
+                    WHERE product_template.id = ANY(%(ids)s)
+                    GROUP BY product_template.id
+                ) AS product
+            WHERE lang.active
+        """, {'ids': self.ids})
 
-        self.env.cr.execute(query)
-        query_res = self.env.cr.dictfetchall()
+    @api.model
+    def _dr_full_text_query(self, search, document):
+        """ Subquery of the products matching all the words of the search (as prefixes)
+
+            :param document: 'document_name' or 'document' (with descriptions)
+            :return: tuple (Query, tsquery) to use in domains and rank the products, (None, None) without words
+        """
+        words = re.findall(r'\w+', search.lower())
+        if not words:
+            return None, None
+        tsquery = ' & '.join(f'{word}:*' for word in words)
+        return Query(self.env, 'full_text', SQL(
+            "(SELECT product_tmpl_id AS id FROM dr_product_search_document WHERE lang = %s AND %s @@ to_tsquery('simple', %s))",
+            self.env.lang or 'en_US', SQL.identifier(document), tsquery,
+        )), tsquery
 
-        website = self.env['website'].get_current_website()
-        all_categ = self.env['product.public.category'].search(website.website_domain())
-        all_categ_data = [{'path': pc.parent_path, 'parent_id': pc.parent_id.id, 'product_public_category_id': pc.id} for pc in all_categ]
+    @api.model
+    def _dr_has_search_documents(self):
+        """ True if the search documents of the current language are built (else searches fallback to ilike) """
+        lang = self.env.lang or 'en_US'
+        return self._dr_has_search_documents_cached(lang, self.env['website']._dr_get_cache_versions(['catalog', 'search_results']))
+
+    @tools.ormcache('lang', 'versions')
+    def _dr_has_search_documents_cached(self, lang, versions):
+        self.env.cr.execute("SELECT to_regclass('dr_product_search_document') IS NOT NULL")
+        if not self.env.cr.fetchone()[0]:
+            return False
+        self.env.cr.execute("SELECT EXISTS(SELECT 1 FROM dr_product_search_document WHERE lang = %s)", (lang,))
+        return self.env.cr.fetchone()[0]
 
-        result_count = dict([(categ.id, 0) for categ in all_categ])
+    @api.model
+    def _dr_search_domain(self, search_detail, search):
+        """ Domain of the products matching the search: the GIN indexed full text documents (prefixes of words)
+            when they are built, else the ilike domains on the search fields.
+
+            :return: tuple (domain, tsquery to rank the products or None with the ilike domains)
+        """
+        base_domain = search_detail['base_domain']
+        if search and search_detail.get('dr_full_text') and self._dr_has_search_documents():
+            full_text_query, tsquery = self._dr_full_text_query(search, search_detail['dr_full_text'])
+            if full_text_query:
+                return expression.AND(base_domain + [[('id', 'in', full_text_query)]]), tsquery
+        return self._search_build_domain(base_domain, search, search_detail['search_fields'], search_detail.get('search_extra')), None
+
+    # ----------------------------------------------------------
+    # Bestseller ranking
+    # ----------------------------------------------------------
+    # dr_product_bestseller_daily: sold quantity per website, product and day (only recent days are rescanned)
+    # dr_product_bestseller: rank per website, globally (categ_id NULL) and optionally per public category
+
+    def _dr_init_bestseller_ranking(self):
+        self.env.cr.execute("""
+            CREATE TABLE IF NOT EXISTS dr_product_bestseller_daily (
+                website_id INTEGER NOT NULL REFERENCES website(id) ON DELETE CASCADE,
+                product_tmpl_id INTEGER NOT NULL REFERENCES product_template(id) ON DELETE CASCADE,
+                sale_date DATE NOT NULL,
+                qty NUMERIC NOT NULL,
+                PRIMARY KEY (website_id, product_tmpl_id, sale_date)
+            );
+            CREATE TABLE IF NOT EXISTS dr_product_bestseller (
+                website_id INTEGER NOT NULL REFERENCES website(id) ON DELETE CASCADE,
+                categ_id INTEGER REFERENCES product_public_category(id) ON DELETE CASCADE,
+                product_tmpl_id INTEGER NOT NULL REFERENCES product_template(id) ON DELETE CASCADE,
+                qty NUMERIC NOT NULL,
+                rank INTEGER NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS dr_product_bestseller_rank_idx ON dr_product_bestseller (website_id, categ_id, rank);
+        """)
+        # Bestseller ordering must not be empty until the first run of the cron
+        self.env.cr.execute("SELECT 1 FROM dr_product_bestseller_daily LIMIT 1")
+        if not self.env.cr.fetchone():
+            self._cron_dr_refresh_bestsellers()
 
-        for line in all_categ_data:
-            for line2 in query_res:
-                if line.get('parent_id'):
-                    path_pattern = '/%s/' % line.get('product_public_category_id')
-                    if path_pattern in line2.get('path'):
-                        result_count[line.get('product_public_category_id')] += line2.get('count')
-                else:
-                    path_pattern = '%s/' % line.get('product_public_category_id')
-                    if line2.get('path').startswith(path_pattern):
-                        result_count[line.get('product_public_category_id')] += line2.get('count')
+    @api.model
+    def _cron_dr_refresh_bestsellers(self):
+        """ Refresh the bestseller ranking of all websites.
+
+            Days already aggregated are kept, only the last two are rescanned for late confirmations.
+            Whole window is rescanned when its size changed (a larger window needs the older orders).
+            System parameters: theme_prime.bestseller_days (window, default 30) and
+            theme_prime.bestseller_per_category (also rank products inside every public category).
+        """
+        ICP = self.env['ir.config_parameter'].sudo()
+        window_days = int(ICP.get_param('theme_prime.bestseller_days', 30))
+        per_category = str2bool(ICP.get_param('theme_prime.bestseller_per_category', 'False'))
+        since = fields.Date.context_today(self) - datetime.timedelta(days=window_days)
+
+        self.env.cr.execute("DELETE FROM dr_product_bestseller_daily WHERE sale_date < %s", (since,))
+        self.env.cr.execute("SELECT max(sale_date) FROM dr_product_bestseller_daily")
+        last_date = self.env.cr.fetchone()[0]
+        rescan_from = max(since, last_date - datetime.timedelta(days=1)) if last_date else since
+        if ICP.get_param('theme_prime.bestseller_scanned_days') != str(window_days):
+            rescan_from = since
+            ICP.set_param('theme_prime.bestseller_scanned_days', window_days)
+
+        self.env['sale.order.line'].flush_model()
+        self.env['sale.order'].flush_model()
+        self.env.cr.execute("""
+            DELETE FROM dr_product_bestseller_daily WHERE sale_date >= %(rescan_from)s;
+
+            INSERT INTO dr_product_bestseller_daily (website_id, product_tmpl_id, sale_date, qty)
+            SELECT sale_order.website_id, product_product.product_tmpl_id, sale_order.date_order::date, sum(sale_order_line.product_uom_qty)
+            FROM sale_order_line
+                JOIN sale_order ON sale_order.id = sale_order_line.order_id
+                JOIN product_product ON product_product.id = sale_order_line.product_id
+            WHERE sale_order.website_id IS NOT NULL AND sale_order.state IN ('sale', 'done') AND sale_order.date_order >= %(rescan_from)s
+            GROUP BY sale_order.website_id, product_product.product_tmpl_id, sale_order.date_order::date;
+
+            DELETE FROM dr_product_bestseller;
+
+            INSERT INTO dr_product_bestseller (website_id, categ_id, product_tmpl_id, qty, rank)
+            SELECT website_id, NULL, product_tmpl_id, sum(qty), row_number() OVER (PARTITION BY website_id ORDER BY sum(qty) DESC, product_tmpl_id)
+            FROM dr_product_bestseller_daily
+            GROUP BY website_id, product_tmpl_id;
+        """, {'rescan_from': rescan_from})
+
+        if per_category:
+            # Products are ranked in their categories and all the ancestors (category closure table)
+            self.env.cr.execute("""
+                INSERT INTO dr_product_bestseller (website_id, categ_id, product_tmpl_id, qty, rank)
+                SELECT daily.website_id, categ.ancestor_id, daily.product_tmpl_id, sum(daily.qty),
+                    row_number() OVER (PARTITION BY daily.website_id, categ.ancestor_id ORDER BY sum(daily.qty) DESC, daily.product_tmpl_id)
+                FROM dr_product_bestseller_daily AS daily
+                    JOIN (
+                        SELECT DISTINCT categ_rel.product_template_id, closure.ancestor_id
+                        FROM product_public_category_product_template_rel AS categ_rel
+                            JOIN dr_product_public_category_closure AS closure ON closure.descendant_id = categ_rel.product_public_category_id
+                    ) AS categ ON categ.product_template_id = daily.product_tmpl_id
+                GROUP BY daily.website_id, categ.ancestor_id, daily.product_tmpl_id
+            """)
 
-        return result_count
+    @api.model
+    def _dr_get_bestseller_ids(self, website, category_id=None):
+        """ Ranked bestseller template ids of the website, ranking of the category if computed else global """
+        if category_id:
+            self.env.cr.execute("SELECT product_tmpl_id FROM dr_product_bestseller WHERE website_id = %s AND categ_id = %s ORDER BY rank", (website.id, category_id))
+            ranked_ids = [x[0] for x in self.env.cr.fetchall()]
+            if ranked_ids:
+                return ranked_ids
+        self.env.cr.execute("SELECT product_tmpl_id FROM dr_product_bestseller WHERE website_id = %s AND categ_id IS NULL ORDER BY rank", (website.id,))
+        return [x[0] for x in self.env.cr.fetchall()]
 
-    def _get_product_attrib_count(self, attrib_values, domain=[]):
-        from_clause, where_clause = self._dr_prepare_query_parts(domain)
+    @api.model
+    def _dr_get_top_products_by_category(self, domain, category_ids, limit, order=None, include_child=True):
+        """ Top products and cheapest product of many categories in one windowed query.
+
+            Categories are expanded with the category closure table, the cheapest product (by list price)
+            always includes child categories.
+            :return: tuple (dict category_id -> ranked product ids, dict category_id -> cheapest product id)
+        """
+        top_product_ids = {category_id: [] for category_id in category_ids}
+        cheapest_product_ids = {}
+        if not category_ids:
+            return top_product_ids, cheapest_product_ids
 
-        query = SQL(
+        query = self._where_calc(domain)
+        self._apply_ir_rules(query)
+        website = self.env['website'].get_current_website()
+        bestseller_join = SQL()
+        if order == 'bestseller':
+            # Ranking of the category (theme_prime.bestseller_per_category) first, then the global ranking
+            bestseller_join = SQL(
+                """
+                    LEFT JOIN dr_product_bestseller AS categ_bestseller ON categ_bestseller.website_id = %(website_id)s
+                        AND categ_bestseller.categ_id = categ.ancestor_id AND categ_bestseller.product_tmpl_id = product_template.id
+                    LEFT JOIN dr_product_bestseller AS bestseller ON bestseller.website_id = %(website_id)s
+                        AND bestseller.categ_id IS NULL AND bestseller.product_tmpl_id = product_template.id
+                """,
+                website_id=website.id,
+            )
+            order_sql = SQL("categ_bestseller.rank IS NULL, categ_bestseller.rank, bestseller.rank IS NULL, bestseller.rank, product_template.id")
+        else:
+            order_sql = SQL("%s, product_template.id", self._order_to_sql(order or self._order, query))
+
+        self.env.cr.execute(SQL(
             """
-                SELECT
-                    array_agg(product_template_attribute_line.product_tmpl_id) as product_tmpl_ids,
-                    min(product_template_attribute_line.attribute_id) as product_attrib_id,
-                    product_attribute_value.id
-                FROM product_template_attribute_line
-                JOIN product_attribute_value_product_template_attribute_line_rel
-                    ON product_attribute_value_product_template_attribute_line_rel.product_template_attribute_line_id = product_template_attribute_line.id
-                JOIN product_attribute_value
-                    ON product_attribute_value.id = product_attribute_value_product_template_attribute_line_rel.product_attribute_value_id
-                JOIN product_template ON product_template.id = product_template_attribute_line.product_tmpl_id
-                %(from_clause)s
-                WHERE %(where_clause)s or product_template.id is NULL
-                GROUP BY product_attribute_value.id
-                ORDER BY product_attrib_id;
+                SELECT categ_id, product_id, top_rank <= %(limit)s AND eligible, price_rank = 1 FROM (
+                    SELECT
+                        categ.ancestor_id AS categ_id,
+                        product_template.id AS product_id,
+                        (%(include_child)s OR categ.is_direct) AS eligible,
+                        row_number() OVER (PARTITION BY categ.ancestor_id, (%(include_child)s OR categ.is_direct) ORDER BY %(order_sql)s) AS top_rank,
+                        row_number() OVER (PARTITION BY categ.ancestor_id ORDER BY product_template.list_price, product_template.id) AS price_rank
+                    FROM %(from_clause)s
+                        JOIN (
+                            SELECT categ_rel.product_template_id, closure.ancestor_id, bool_or(closure.ancestor_id = categ_rel.product_public_category_id) AS is_direct
+                            FROM product_public_category_product_template_rel AS categ_rel
+                                JOIN dr_product_public_category_closure AS closure ON closure.descendant_id = categ_rel.product_public_category_id
+                            WHERE closure.ancestor_id IN %(category_ids)s
+                            GROUP BY categ_rel.product_template_id, closure.ancestor_id
+                        ) AS categ ON categ.product_template_id = product_template.id
+                        %(bestseller_join)s
+                    WHERE %(where_clause)s
+                ) AS ranked
+                WHERE (top_rank <= %(limit)s AND eligible) OR price_rank = 1
+                ORDER BY categ_id, top_rank
             """,
-            from_clause=from_clause,
-            where_clause=where_clause,
-        )
-
-        self.env.cr.execute(query)
-        query_res = self.env.cr.dictfetchall()
-
-        result_count = {}
-
-        if attrib_values:
-
-            attrib_values_ids = [v[1] for v in attrib_values]
-            attrib_ids = [v[0] for v in attrib_values]
-            attrib_value_list = dict([(line.get('id'), line.get('product_tmpl_ids') or []) for line in query_res])
+            limit=limit,
+            include_child=bool(include_child),
+            order_sql=order_sql,
+            bestseller_join=bestseller_join,
+            from_clause=query.from_clause,
+            where_clause=query.where_clause,
+            category_ids=tuple(category_ids),
+        ))
+        for category_id, product_id, is_top, is_cheapest in self.env.cr.fetchall():
+            if is_top:
+                top_product_ids[category_id].append(product_id)
+            if is_cheapest:
+                cheapest_product_ids[category_id] = product_id
+        return top_product_ids, cheapest_product_ids
+
+    # ----------------------------------------------------------
+    # Image derivatives
+    # ----------------------------------------------------------
+    # Attachments dr_image_<size>.<format> of the product (no res_field), generated by the cron
+    # dr_product_image_derivative_pending: products whose image was written since their derivatives were generated
+
+    def _dr_init_image_derivatives(self):
+        self.env.cr.execute("""
+            CREATE TABLE IF NOT EXISTS dr_product_image_derivative_pending (
+                product_tmpl_id INTEGER PRIMARY KEY REFERENCES product_template(id) ON DELETE CASCADE
+            );
+
+            INSERT INTO dr_product_image_derivative_pending (product_tmpl_id)
+            SELECT product.id FROM product_template AS product
+            WHERE EXISTS (SELECT 1 FROM ir_attachment WHERE res_model = 'product.template' AND res_field = 'image_1920' AND res_id = product.id)
+                AND NOT EXISTS (SELECT 1 FROM ir_attachment WHERE res_model = 'product.template' AND res_field IS NULL AND res_id = product.id AND name LIKE 'dr\\_image\\_%')
+            ON CONFLICT DO NOTHING
+        """)
+
+    def _dr_mark_image_derivatives_pending(self):
+        """ Drop the derivatives of the old images and let the cron encode the new ones (out of the write transaction) """
+        self.env['ir.attachment'].sudo().search(self._dr_image_derivative_domain()).unlink()
+        if self and DR_IMAGE_DERIVATIVE_FORMATS:
+            self.env.cr.execute("""
+                INSERT INTO dr_product_image_derivative_pending (product_tmpl_id) SELECT unnest(%s::int[]) ON CONFLICT DO NOTHING
+            """, (self.ids,))
+            self.env.ref('theme_prime.ir_cron_dr_image_derivatives').sudo()._trigger()
+
+    def _dr_image_derivative_domain(self):
+        return [('res_model', '=', 'product.template'), ('res_id', 'in', self.ids), ('name', '=like', 'dr\\_image\\_%')]
+
+    def _dr_generate_image_derivatives(self):
+        """ (Re)generate the modern format variants of the product images at the snippet sizes """
+        Attachment = self.env['ir.attachment'].sudo()
+        Attachment.search(self._dr_image_derivative_domain()).unlink()
+        if not DR_IMAGE_DERIVATIVE_FORMATS:
+            return
+        vals_list = []
+        for product in self.with_context(bin_size=False):
+            if not product.image_1920:
+                continue
+            image_process = ImageProcess(base64.b64decode(product.image_1920))
+            if not image_process.image:  # SVG
+                continue
+            # Sizes are decreasing, every resize starts from the previous one
+            for size in DR_IMAGE_DERIVATIVE_SIZES:
+                image = image_process.resize(size, size).image
+                if image.mode not in ('RGB', 'RGBA'):
+                    image = image.convert('RGBA')
+                for image_format in DR_IMAGE_DERIVATIVE_FORMATS:
+                    output = io.BytesIO()
+                    image.save(output, format=image_format.upper(), quality=80)
+                    vals_list.append({
+                        'name': 'dr_image_%s.%s' % (size, image_format),
+                        'res_model': 'product.template',
+                        'res_id': product.id,
+                        'raw': output.getvalue(),
+                        'mimetype': 'image/%s' % image_format,
+                    })
+        Attachment.create(vals_list)
+
+    def _dr_get_image_derivative_product_ids(self):
+        """ :return: set of ids of the products having image derivatives (one query for the recordset) """
+        if not self or not DR_IMAGE_DERIVATIVE_FORMATS:
+            return set()
+        groups = self.env['ir.attachment'].sudo()._read_group(self._dr_image_derivative_domain(), ['res_id'])
+        return {res_id for [res_id] in groups}
+
+    def _dr_get_image_derivative(self, size, accepted_mimetypes):
+        """ :return: best derivative attachment of the product for the accepted mimetypes, empty recordset if none """
+        self.ensure_one()
+        accepted_formats = [image_format for image_format in DR_IMAGE_DERIVATIVE_FORMATS if 'image/%s' % image_format in accepted_mimetypes]
+        if not accepted_formats:
+            return self.env['ir.attachment']
+        attachments = self.env['ir.attachment'].sudo().search(expression.AND([
+            self._dr_image_derivative_domain(),
+            [('name', 'in', ['dr_image_%s.%s' % (size, image_format) for image_format in accepted_formats])],
+        ]))
+        attachments = attachments.sorted(lambda attachment: accepted_formats.index(attachment.name.rsplit('.', 1)[1]))
+        return attachments[:1]
+
+    def _cron_dr_generate_image_derivatives(self, batch_size=50):
+        """ Generate the derivatives of one batch of pending products, the cron runs again while some are left """
+        self.env.cr.execute("""
+            DELETE FROM dr_product_image_derivative_pending WHERE product_tmpl_id IN (
+                SELECT product_tmpl_id FROM dr_product_image_derivative_pending ORDER BY product_tmpl_id LIMIT %s
+            ) RETURNING product_tmpl_id
+        """, (batch_size,))
+        products = self.with_context(active_test=False).browse([row[0] for row in self.env.cr.fetchall()]).exists()
+        for product in products:
+            try:
+                with self.env.cr.savepoint():
+                    product._dr_generate_image_derivatives()
+            except Exception:
+                _logger.warning("Image derivatives of product %s could not be generated", product.id, exc_info=True)
+        self.env.cr.execute("SELECT count(*) FROM dr_product_image_derivative_pending")
+        self.env['ir.cron']._notify_progress(done=len(products), remaining=self.env.cr.fetchone()[0])
+
+    def _dr_get_combination_info_batch(self, website):
+        """ Template combination info (price part) of the whole recordset.
+
+            Prices come from one batched pricelist evaluation (_get_sales_prices) instead of
+            one _get_combination_info call per template.
+            :return: dict template_id -> combination info
+        """
+        sales_prices = self._get_sales_prices(website)
+        currency = website.currency_id
+        result = {}
+        for template in self:
+            price_vals = sales_prices.get(template.id, {})
+            price = price_vals.get('price_reduce', 0.0)
+            list_price = price_vals.get('base_price', price)
+            result[template.id] = {
+                'product_id': False,
+                'product_template_id': template.id,
+                'display_name': template.display_name,
+                'price': price,
+                'list_price': list_price,
+                'has_discounted_price': currency.compare_amounts(list_price, price) == 1,
+            }
+        return result
 
-            # Attribute -> Attribute Vals map
-            attrib_vals_map = {}
-            for line in query_res:
-                if not attrib_vals_map.get(line['product_attrib_id']):
-                    attrib_vals_map[line['product_attrib_id']] = []
-                attrib_vals_map[line['product_attrib_id']].append(line['id'])
+    def _dr_get_first_possible_variant_ids(self):
+        """ Single variant templates (most of the catalog) are resolved from prefetched variants """
+        return {template.id: template.product_variant_id.id if template.product_variant_count == 1 else template._get_first_possible_variant_id() for template in self}
 
-            # Attribute -> active product list
-            attrib_p_list = {}
-            for line in query_res:
+    def _dr_process_product_data(self, product_pricelist_data, product):
+        return {'display_name': product_pricelist_data['display_name'], 'price': product_pricelist_data['price'], 'id': product_pricelist_data['product_template_id']}
 
-                value_id_1 = line.get('id')
-                product_ids_1 = line.get('product_tmpl_ids') or []
-                attrib_id_1 = line.get('product_attrib_id')
+    def _compute_dr_has_discount(self):
+        for product in self:
+            product.dr_has_discount = False
 
-                if not attrib_p_list.get(attrib_id_1):
-                    attrib_p_list[attrib_id_1] = set()
+    def _get_product_category_count(self, domain=[]):
+        return self._get_product_facet_counts(domain, facets=['category'])['category']
 
-                if value_id_1 in attrib_values_ids:
-                    attrib_p_list[attrib_id_1] = attrib_p_list[attrib_id_1] | set(product_ids_1)
+    def _get_product_attrib_count(self, attrib_values, domain=[]):
+        return self._get_product_facet_counts(domain, attrib_values=attrib_values, facets=['attribute'])['attribute']
 
-            # Attribute -> final list
-            attrib_product_list = {}
-            for line in query_res:
-                value_id_1 = line.get('id')
-                product_ids_1 = line.get('product_tmpl_ids') or []
-                attrib_id_1 = line.get('product_attrib_id')
+    def _get_product_rating_count(self, domain=[]):
+        return self._get_product_facet_counts(domain, facets=['rating'])['rating']
 
-                if not attrib_product_list.get(value_id_1):
-                    attrib_product_list[value_id_1] = set(product_ids_1)
+    def _get_product_facet_counts(self, domain=[], category_id=None, attrib_values=None, min_rating=None, facets=('category', 'attribute', 'rating')):
+        """ Category, attribute and rating counts of shop filters in a single query.
 
-                for line_2 in query_res:
-                    value_id_2 = line_2.get('id')
-                    product_ids_2 = line_2.get('product_tmpl_ids') or []
-                    attrib_id_2 = line_2.get('product_attrib_id')
+            Products matching the domain are collected once as candidates, then every facet family
+            applies all the selected filters except its own (count "if this one was selected").
 
-                    if value_id_2 not in attrib_vals_map.get(attrib_id_1, []) and value_id_2 in attrib_values_ids:
-                        attrib_product_list[value_id_1] = attrib_product_list[value_id_1] & attrib_p_list.get(attrib_id_2, set())
+            :param category_id: selected public category
+            :param attrib_values: selected [attribute_id, value_id] pairs
+            :param min_rating: lowest selected rating
+            :param facets: facet families to compute, subset of category, attribute and rating
+        """
+        from_clause, where_clause = self._dr_prepare_query_parts(domain)
 
-            result_count = dict([(val_id, len(product_ids)) for val_id, product_ids in attrib_product_list.items()])
-        else:
-            result_count = dict([(line.get('id'), len(line.get('product_tmpl_ids') or [])) for line in query_res])
-        return result_count
+        attrib_domain = []
+        for attrib_id in {v[0] for v in attrib_values or []}:
+            value_ids = [v[1] for v in attrib_values if v[0] == attrib_id]
+            attrib_domain = expression.AND([attrib_domain, [('attribute_line_ids.value_ids', 'in', value_ids)]])
+
+        facet_queries = []
+        if 'category' in facets:
+            # Products of child categories are rolled up to all their ancestors by the category closure table
+            facet_queries.append(SQL(
+                """
+                    SELECT 'category', closure.ancestor_id, NULL::int, count(DISTINCT candidate.id), NULL::int[]
+                    FROM candidate
+                        JOIN product_public_category_product_template_rel AS categ_rel ON categ_rel.product_template_id = candidate.id
+                        JOIN dr_product_public_category_closure AS closure ON closure.descendant_id = categ_rel.product_public_category_id
+                    WHERE candidate.attrib_match AND candidate.rating_match
+                    GROUP BY closure.ancestor_id
+                """
+            ))
+        if 'attribute' in facets:
+            facet_queries.append(SQL(
+                """
+                    SELECT 'attribute', value_rel.product_attribute_value_id, min(attrib_line.attribute_id), count(*), array_agg(attrib_line.product_tmpl_id)
+                    FROM candidate
+                        JOIN product_template_attribute_line AS attrib_line ON attrib_line.product_tmpl_id = candidate.id
+                        JOIN product_attribute_value_product_template_attribute_line_rel AS value_rel ON value_rel.product_template_attribute_line_id = attrib_line.id
+                    WHERE candidate.category_match AND candidate.rating_match
+                    GROUP BY value_rel.product_attribute_value_id
+                """
+            ))
+        if 'rating' in facets:
+            facet_queries.append(SQL(
+                """
+                    SELECT 'rating', candidate.dr_rating_bucket, NULL::int, count(*), NULL::int[]
+                    FROM candidate
+                    WHERE candidate.category_match AND candidate.attrib_match AND candidate.dr_rating_count > 0
+                    GROUP BY candidate.dr_rating_bucket
+                """
+            ))
 
-    def _get_product_rating_count(self, domain=[]):
-        from_clause, where_clause = self._dr_prepare_query_parts(domain)
         query = SQL(
             """
-                SELECT avg_rating, count(*) FROM (
-                    SELECT FLOOR(avg(rating)) as avg_rating, rating_rating.res_id FROM rating_rating JOIN product_template ON product_template.id = rating_rating.res_id %(from_clause)s
-                        WHERE (%(where_clause)s) AND rating_rating.res_model = 'product.template' AND rating_rating.is_internal = False
-                GROUP BY rating_rating.res_id) AS rating_count group by avg_rating;
+                WITH candidate AS MATERIALIZED (
+                    SELECT
+                        product_template.id,
+                        product_template.dr_rating_bucket,
+                        product_template.dr_rating_count,
+                        (%(category_match)s) AS category_match,
+                        (%(attrib_match)s) AS attrib_match,
+                        (%(rating_match)s) AS rating_match
+                    FROM product_template %(from_clause)s
+                    WHERE %(where_clause)s
+                )
+                %(facet_queries)s
             """,
+            category_match=self._dr_facet_filter([('public_categ_ids', 'child_of', category_id)] if category_id else []),
+            attrib_match=self._dr_facet_filter(attrib_domain),
+            rating_match=self._dr_facet_filter([('dr_rating_bucket', '>=', min_rating)] if min_rating else []),
             from_clause=from_clause,
             where_clause=where_clause,
+            facet_queries=SQL(" UNION ALL ").join(facet_queries),
         )
         self.env.cr.execute(query)
-        query_result = dict(self.env.cr.fetchall())
-        total = 0
-        ratings_result = {rating: 0 for rating in range(1, 6)}
-        for result in range(5, 0, -1):
-            total += query_result.get(result, 0)
-            ratings_result[result] = total
-        return ratings_result
+
+        facet_rows = {facet: [] for facet in facets}
+        for facet, key, attrib_id, count, product_ids in self.env.cr.fetchall():
+            facet_rows[facet].append((key, attrib_id, count, product_ids))
+
+        result = {}
+        if 'category' in facets:
+            category_count = {key: count for key, attrib_id, count, product_ids in facet_rows['category']}
+            website = self.env['website'].get_current_website()
+            all_categ = self.env['product.public.category'].search(website.website_domain())
+            result['category'] = {categ_id: category_count.get(categ_id, 0) for categ_id in all_categ.ids}
+        if 'attribute' in facets:
+            if attrib_values:
+                query_res = [{'id': key, 'product_attrib_id': attrib_id, 'product_tmpl_ids': product_ids} for key, attrib_id, count, product_ids in facet_rows['attribute']]
+                result['attribute'] = _dr_attrib_bitmap_count(query_res, {v[1] for v in attrib_values})
+            else:
+                result['attribute'] = {key: count for key, attrib_id, count, product_ids in facet_rows['attribute']}
+        if 'rating' in facets:
+            rating_count = {key: count for key, attrib_id, count, product_ids in facet_rows['rating']}
+            total = 0
+            result['rating'] = {rating: 0 for rating in range(1, 6)}
+            for rating in range(5, 0, -1):
+                total += rating_count.get(rating, 0)
+                result['rating'][rating] = total
+        return result
+
+    def _dr_facet_filter(self, domain):
+        return self._where_calc(domain).where_clause if domain else SQL("TRUE")
 
     def _dr_prepare_query_parts(self, domain):
         query = self._where_calc(domain)
@@ -228,11 +778,104 @@ class ProductTemplate(models.Model):
         if search_detail.get('dr_search_domain'):
             search_detail['base_domain'].append(search_detail.get('dr_search_domain'))
             search = False
-        return super()._search_fetch(search_detail, search, limit, order)
+        domain, tsquery = self._dr_search_domain(search_detail, search) if search else (None, None)
+        if tsquery:
+            results, count = self._dr_search_fetch_full_text(search_detail, limit, order, domain, tsquery)
+        else:
+            results, count = super()._search_fetch(search_detail, search, limit, order)
+        # Collect the ids when all the matching products are fetched (used as candidates for longer terms)
+        if search_detail.get('dr_matched_ids') is not None and count <= len(results):
+            search_detail['dr_matched_ids'].extend(results.ids)
+        return results, count
+
+    def _dr_search_fetch_full_text(self, search_detail, limit, order, domain, tsquery):
+        """ Products of the full text domain (see _dr_search_domain).
+            With dr_rank, the best ranked products come first and the limit is applied by the database.
+        """
+        model = self.sudo() if search_detail.get('requires_sudo') else self
+        if search_detail.get('dr_rank'):
+            query = model._search(domain)
+            document = search_detail['dr_full_text']
+            query.add_join('JOIN', 'search_document', 'dr_product_search_document', SQL(
+                "%s = %s AND %s = %s",
+                SQL.identifier('search_document', 'product_tmpl_id'), SQL.identifier(query.table, 'id'),
+                SQL.identifier('search_document', 'lang'), self.env.lang or 'en_US',
+            ))
+            query.order = SQL(
+                "ts_rank(%s, to_tsquery('simple', %s)) DESC, %s",
+                SQL.identifier('search_document', document), tsquery, SQL.identifier(query.table, 'id'),
+            )
+            query.limit = limit
+            self.env.cr.execute(query.select())
+            results = model.browse([row[0] for row in self.env.cr.fetchall()])
+        else:
+            results = model.search(domain, limit=limit, order=search_detail.get('order', order))
+        count = model.search_count(domain) if limit and limit == len(results) else len(results)
+        return results, count
 
     @api.model
     def _search_get_detail(self, website, order, options):
         result = super()._search_get_detail(website, order, options)
         if options.get('dr_search_domain'):
             result['dr_search_domain'] = options.get('dr_search_domain')
+        if options.get('dr_candidate_ids') is not None:
+            result['base_domain'].append([('id', 'in', options['dr_candidate_ids'])])
+        if options.get('dr_matched_ids') is not None:
+            result['dr_matched_ids'] = options['dr_matched_ids']
+        result['dr_full_text'] = 'document' if options.get('displayDescription') else 'document_name'
+        result['dr_rank'] = options.get('dr_rank')
         return result
+
+
+def _dr_product_bitmap(product_ids, positions, size):
+    """ Set of product templates as a python integer with one bit per template.
+
+        AND/OR/popcount on integers run in C over machine words instead of hashing python sets.
+    """
+    buffer = bytearray(size)
+    for product_id in product_ids:
+        position = positions[product_id]
+        buffer[position >> 3] |= 1 << (position & 7)
+    return int.from_bytes(buffer, 'little')
+
+
+def _dr_attrib_bitmap_count(query_res, selected_value_ids):
+    """ Count of every attribute value as if it was also selected.
+
+        Values of the same attribute are OR-ed and different attributes are AND-ed (shop filter logic),
+        so the count of a value is its products AND the selection of all the other attributes.
+        Bitmaps of non selected values are built one at a time to keep memory low on big catalogs.
+    """
+    positions = {}
+    for line in query_res:
+        for product_id in line.get('product_tmpl_ids') or []:
+            if product_id not in positions:
+                positions[product_id] = len(positions)
+    size = (len(positions) >> 3) + 1
+
+    # Attribute -> products matching its selected values
+    selected_attrib_bitmaps = {}
+    for line in query_res:
+        if line.get('id') in selected_value_ids:
+            attrib_id = line.get('product_attrib_id')
+            bitmap = _dr_product_bitmap(line.get('product_tmpl_ids') or [], positions, size)
+            selected_attrib_bitmaps[attrib_id] = selected_attrib_bitmaps.get(attrib_id, 0) | bitmap
+
+    # Attribute -> products matching the selection of all other attributes (-1 means no restriction)
+    attrib_masks = {}
+    for attrib_id in {line.get('product_attrib_id') for line in query_res}:
+        mask = -1
+        for other_attrib_id, attrib_bitmap in selected_attrib_bitmaps.items():
+            if other_attrib_id != attrib_id:
+                mask &= attrib_bitmap
+        attrib_masks[attrib_id] = mask
+
+    result_count = {}
+    for line in query_res:
+        product_ids = line.get('product_tmpl_ids') or []
+        mask = attrib_masks[line.get('product_attrib_id')]
+        if mask == -1:
+            result_count[line.get('id')] = len(product_ids)
+        else:
+            result_count[line.get('id')] = (_dr_product_bitmap(product_ids, positions, size) & mask).bit_count()
+    return result_count
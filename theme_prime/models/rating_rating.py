@@ -0,0 +1,31 @@
+# -*- coding: utf-8 -*-
+# Copyright (c) 2019-Present Droggol Infotech Private Limited. (<https://www.droggol.com/>)
+
+from odoo import models, api
+
+
+class RatingRating(models.Model):
+    _inherit = 'rating.rating'
+
+    @api.model_create_multi
+    def create(self, vals_list):
+        ratings = super().create(vals_list)
+        ratings._dr_rated_products()._dr_update_rating_summary()
+        return ratings
+
+    def write(self, vals):
+        if not {'rating', 'is_internal', 'res_model', 'res_id'} & set(vals):
+            return super().write(vals)
+        products = self._dr_rated_products()
+        res = super().write(vals)
+        (products | self._dr_rated_products())._dr_update_rating_summary()
+        return res
+
+    def unlink(self):
+        products = self._dr_rated_products()
+        res = super().unlink()
+        products._dr_update_rating_summary()
+        return res
+
+    def _dr_rated_products(self):
+        return self.env['product.template'].browse({rating.res_id for rating in self.sudo() if rating.res_model == 'product.template' and rating.res_id})
@@ -0,0 +1,656 @@
+# -*- coding: utf-8 -*-
+# Copyright (c) 2019-Present Droggol Infotech Private Limited. (<https://www.droggol.com/>)
+
+import base64
+import functools
+import hashlib
+import json
+import logging
+import re
+import threading
+import time
+from collections import Counter, OrderedDict, defaultdict, deque
+from itertools import groupby
+
+from markupsafe import Markup, escape
+
+from odoo import models, api, tools
+from odoo.tools import SQL
+from odoo.tools.mimetypes import guess_mimetype
+
+_logger = logging.getLogger(__name__)
+
+# Names of the cache versions, payloads cached on them are invalidated by _dr_bump_cache_version
+DR_CACHE_VERSION_NAMES = ['catalog', 'search_index', 'search_attributes', 'search_results', 'pricelist', 'product_nav']
+
+
+class Website(models.Model):
+    _inherit = 'website'
+
+    def init(self):
+        # Version counters of cached payloads, one sequence per name (see _dr_bump_cache_version)
+        for name in DR_CACHE_VERSION_NAMES:
+            self.env.cr.execute(SQL("CREATE SEQUENCE IF NOT EXISTS %s", SQL.identifier('dr_cache_version_' + name)))
+        self.env.cr.execute("""
+            CREATE TABLE IF NOT EXISTS dr_search_index_snapshot (
+                website_id INTEGER NOT NULL REFERENCES website(id) ON DELETE CASCADE,
+                lang VARCHAR NOT NULL,
+                version INTEGER NOT NULL,
+                attribute_ids INTEGER[] NOT NULL,
+                entries JSONB NOT NULL,
+                PRIMARY KEY (website_id, lang)
+            );
+            CREATE TABLE IF NOT EXISTS dr_search_vocabulary (
+                word VARCHAR PRIMARY KEY
+            );
+        """)
+        if self.env.registry.has_trigram:
+            self.env.cr.execute("CREATE INDEX IF NOT EXISTS dr_search_vocabulary_word_trgm_idx ON dr_search_vocabulary USING gin (word gin_trgm_ops)")
+        self._cron_dr_refresh_search_vocabulary()
+
+    @api.model
+    def _dr_get_cache_version(self, name):
+        return self._dr_get_cache_versions([name])[0]
+
+    def _dr_get_cache_versions(self, names):
+        self.env.cr.execute(SQL("SELECT %s", SQL(", ").join(
+            SQL("(SELECT CASE WHEN is_called THEN last_value ELSE 0 END FROM %s)", SQL.identifier('dr_cache_version_' + name))
+            for name in names
+        )))
+        return self.env.cr.fetchone()
+
+    @api.model
+    def _dr_bump_cache_version(self, *names):
+        """ Invalidate the cached payloads keyed on the version of ``names`` (e.g. catalog) in all workers.
+
+            Sequences are not transactional, concurrent writers never wait for each other. The versions are bumped
+            again after the commit so a payload cached by another worker before the commit (old data) is not reused.
+        """
+        self._dr_next_cache_versions(self.env.cr, names)
+        pending_names = self.env.cr.postcommit.data.setdefault('dr_cache_versions', set())
+        if not pending_names:
+            self.env.cr.postcommit.add(functools.partial(self._dr_bump_pending_cache_versions, self.env.registry, self.env.cr))
+        pending_names.update(names)
+
+    @api.model
+    def _dr_bump_pending_cache_versions(self, registry, cr):
+        names = cr.postcommit.data.pop('dr_cache_versions', set())
+        with registry.cursor() as new_cr:
+            self._dr_next_cache_versions(new_cr, names)
+
+    @api.model
+    def _dr_next_cache_versions(self, cr, names):
+        assert set(names) <= set(DR_CACHE_VERSION_NAMES), "Unknown cache version"
+        cr.execute(SQL("SELECT %s", SQL(", ").join(SQL("nextval(%s)", 'dr_cache_version_' + name) for name in sorted(names))))
+
+    # Rendered html lives in dr_render_cache (not the 'templates' ormcache, it would evict the compiled templates)
+
+    def _dr_get_render_cache_key(self):
+        # The templates cache sequence changes when views are modified (in any worker)
+        return self.env.cr.dbname, self.id, self.env.registry.cache_sequences.get('templates')
+
+    def _dr_render_fragment(self, template, res_model, res_id, write_date, lang, extra_key, values):
+        """ Render a QWeb fragment that only depends on one record, its write date and ``extra_key`` """
+        key = ('fragment', self._dr_get_render_cache_key(), template, res_model, res_id, write_date, lang, extra_key)
+        return dr_render_cache.get_or_render(key, lambda: self.env['ir.qweb']._render(template, values=values, minimal_qcontext=True))
+
+    def _dr_render_quick_view(self, template, product_id, variant_id, cache_key, csrf_token, prepare_values):
+        """ Quick view dialog of a product, ``cache_key`` holds everything else the html depends on.
+
+            :param prepare_values: callable returning the rendering values, only called on a miss
+            :return: tuple (html, csrf token used by the html)
+        """
+        key = ('quick_view', self._dr_get_render_cache_key(), template, product_id, variant_id, cache_key)
+        return dr_render_cache.get_or_render(key, lambda: (self.env['ir.ui.view']._render_template(template, values=prepare_values()), csrf_token))
+
+    def _dr_get_rating_template_cached(self, rating_avg, rating_count, lang):
+        key = ('rating', self._dr_get_render_cache_key(), rating_avg, rating_count, lang)
+        return dr_render_cache.get_or_render(key, lambda: self._get_theme_prime_rating_template(rating_avg, rating_count))
+
+    # ----------------------------------------------------------
+    # Mega menu
+    # ----------------------------------------------------------
+
+    @tools.ormcache('self.id', 'version', 'lang', 'is_internal')
+    def _dr_get_category_tree(self, version, lang, is_internal):
+        """ Website categories with product counts and children adjacency map """
+        categories = self.env['product.public.category'].search(self.website_domain())
+        category_count = self.env['product.template']._get_product_category_count(self.sale_product_domain())
+        nodes, children = {}, defaultdict(list)
+        for category in categories:
+            nodes[category.id] = {
+                'id': category.id, 'name': category.name, 'parent_id': category.parent_id.id,
+                'count': category_count.get(category.id, 0),
+                'website_url': '/shop/category/' + str(category.id),
+                'image_url': '/web/image?model=product.public.category&id=%d&field=image_512' % (category.id),
+                'cover_image': '/web/image?model=product.public.category&id=%d&field=dr_category_cover_image' % (category.id),
+                'dr_category_icon': '/web/image?model=product.public.category&id=%d&field=dr_category_icon' % (category.id),
+                'category_label_info': category.dr_category_label_id and {f: category.dr_category_label_id[f] for f in ['name', 'background_color', 'text_color']} or False,
+            }
+            children[category.parent_id.id].append(category.id)
+        return nodes, dict(children)
+
+    def _dr_get_megamenu_categories(self, category_ids, limit, order, only_direct_child):
+        return self._dr_get_megamenu_payload(
+            self._dr_get_cache_version('catalog'), self.env.lang, self.env.user._is_internal(), tuple(category_ids), limit, order, only_direct_child)
+
+    @tools.ormcache('self.id', 'version', 'lang', 'is_internal', 'category_ids', 'limit', 'order', 'only_direct_child')
+    def _dr_get_megamenu_payload(self, version, lang, is_internal, category_ids, limit, order, only_direct_child):
+        nodes, children = self._dr_get_category_tree(version, lang, is_internal)
+        parent_categories = [node for node in nodes.values() if node['id'] in category_ids]
+        return [self._dr_get_megamenu_child_categories(category, limit, nodes, children, order, only_direct_child) for category in parent_categories]
+
+    def _dr_get_megamenu_child_categories(self, parent_category, limit, nodes, children, order, only_direct_child):
+        child_categories = [nodes[child_id] for child_id in children.get(parent_category['id'], [])]
+        if not child_categories:
+            return {'category': parent_category, 'child': []}
+        if order == 'count' or not order:
+            child_categories = sorted(child_categories, key=lambda category: category.get('count', 0), reverse=True)
+        child_categories = child_categories[:limit]
+        remain_limit = limit - len(child_categories)
+
+        if remain_limit <= 0 or only_direct_child:
+            return {'category': parent_category, 'child': child_categories}
+        for child_category in child_categories[:]:
+            new_born_child = self._dr_get_megamenu_child_categories(child_category, remain_limit, nodes, children, order, only_direct_child).get('child')
+            child_categories.extend(new_born_child)
+            remain_limit = limit - len(child_categories)
+            if remain_limit <= 0:
+                break
+        return {'category': parent_category, 'child': child_categories}
+
+    def _dr_get_active_search_attributes(self):
+        """ Visible search suggestion attributes used by the published products of the website """
+        attribute_ids = self._dr_get_active_search_attribute_ids(
+            self._dr_get_cache_version('catalog'), self._dr_get_cache_version('search_attributes'), self.env.user._is_internal())
+        return self.env['product.attribute'].browse(attribute_ids)
+
+    @tools.ormcache('self.id', 'catalog_version', 'version', 'is_internal')
+    def _dr_get_active_search_attribute_ids(self, catalog_version, version, is_internal):
+        return tuple(self.env['product.attribute'].search([
+            ('product_tmpl_ids', 'any', self.sale_product_domain()), ('visibility', '=', 'visible'), ('dr_search_suggestion', '!=', False)
+        ]).ids)
+
+    # ----------------------------------------------------------
+    # PWA
+    # ----------------------------------------------------------
+
+    def _dr_get_pwa_version_key(self):
+        """ Everything the PWA payloads of the website depend on, used in their cache key (ETag) """
+        screenshots, shortcuts = self.dr_pwa_screenshots, self.dr_pwa_shortcuts
+        return (
+            self.write_date, self.dr_pwa_version, tuple(screenshots.ids), tuple(shortcuts.ids),
+            max(screenshots.mapped('write_date') + shortcuts.mapped('write_date'), default=False),
+        )
+
+    @tools.ormcache('self.id', 'version_key', 'lang')
+    def _dr_get_pwa_manifest(self, version_key, lang):
+        """ :return: tuple (manifest json body, etag) """
+        manifest_data = {"fake": 1}
+        if self.dr_pwa_activated:
+            manifest_data = {
+                "name": self.dr_pwa_name,
+                "short_name": self.dr_pwa_short_name,
+                "display": "standalone",
+                "background_color": self.dr_pwa_background_color,
+                "theme_color": self.dr_pwa_theme_color,
+                "id": self.dr_pwa_start_url,
+                "start_url": self.dr_pwa_start_url,
+                "scope": "/",
+                "icons": [{
+                    "src": "/web/image/website/%s/dr_pwa_icon_192/192x192" % self.id,
+                    "sizes": "192x192",
+                    "type": "image/png",
+                }, {
+                    "src": "/web/image/website/%s/dr_pwa_icon_512/512x512" % self.id,
+                    "sizes": "512x512",
+                    "type": "image/png",
+                }]
+            }
+            if self.dr_pwa_screenshots:
+                manifest_data['screenshots'] = [{
+                    "src": "/web/image/dr.pwa.screenshots/%s/image" % screenshot.id,
+                    "type": "image/jpg",
+                    "sizes": screenshot.sizes,
+                    "form_factor": screenshot.form_factor,
+                } for screenshot in self.dr_pwa_screenshots]
+            if self.dr_pwa_shortcuts:
+                manifest_data['shortcuts'] = [{
+                    "name": shortcut.name,
+                    "short_name": shortcut.short_name or '',
+                    "description": shortcut.description or '',
+                    "url": shortcut.url,
+                    "icons": [{"src": "/web/image/dr.pwa.shortcuts/%s/icon/192x192" % shortcut.id, "sizes": "192x192"}]
+                } for shortcut in self.dr_pwa_shortcuts]
+        return _dr_body_with_etag(json.dumps(manifest_data).encode())
+
+    def _dr_get_pwa_runtime_cache_sizes(self):
+        """ Max entries of the runtime caches of the service worker, 0 disables the cache.
+            System parameters theme_prime.pwa_{asset,image,page}_cache_size, a website can override them with a .<website id> suffix.
+
+            :return: tuple (assets, images, pages)
+        """
+        ICP = self.env['ir.config_parameter'].sudo()
+        sizes = []
+        for name, default in [('asset', 60), ('image', 200), ('page', 30)]:
+            key = 'theme_prime.pwa_%s_cache_size' % name
+            value = ICP.get_param('%s.%s' % (key, self.id)) or ICP.get_param(key)
+            sizes.append(int(value) if value and value.isdigit() else default)
+        return tuple(sizes)
+
+    @tools.ormcache('self.id', 'pwa_version', 'offline_page', 'cache_sizes')
+    def _dr_get_pwa_service_worker(self, pwa_version, offline_page, cache_sizes):
+        """ :return: tuple (service worker script, etag) """
+        with tools.file_open('theme_prime/static/src/js/pwa/service_worker.js', 'rb') as service_worker:
+            data = service_worker.read().decode()
+        data = data.replace('"##1##"', str(pwa_version))
+        data = data.replace('"##2##"', 'true' if offline_page else 'false')
+        for placeholder, size in zip(['"##3##"', '"##4##"', '"##5##"'], cache_sizes):
+            data = data.replace(placeholder, str(size))
+        return _dr_body_with_etag(data.encode())
+
+    @tools.ormcache('self.id', 'write_date')
+    def _dr_get_pwa_logo(self, write_date):
+        """ :return: tuple (logo bytes, etag, mimetype, file extension) """
+        image_data = base64.b64decode(self.logo)
+        mimetype = guess_mimetype(image_data, default='image/png')
+        imgext = '.' + mimetype.split('/')[1]
+        if imgext == '.svg+xml':
+            imgext = '.svg'
+        return _dr_body_with_etag(image_data) + (mimetype, imgext)
+
+    # ----------------------------------------------------------
+    # Product images
+    # ----------------------------------------------------------
+
+    def _dr_get_product_image_urls(self, product, has_derivatives):
+        """ Card image urls of the product: img_small (256), img_medium (512), img_large (1024) and img_srcset.
+
+            Products with image derivatives get the negotiated (WebP/AVIF) immutable urls, the unique part changes with the product.
+        """
+        if not has_derivatives:
+            urls = {size: self.image_url(product, 'image_%s' % size) for size in [256, 512, 1024]}
+        else:
+            unique = hashlib.sha512(str(product.sudo().write_date).encode('utf-8')).hexdigest()[:7]
+            urls = {size: '/theme_prime/product_image/%s-%s/%s' % (product.id, unique, size) for size in [256, 512, 1024]}
+        return {
+            'img_small': urls[256],
+            'img_medium': urls[512],
+            'img_large': urls[1024],
+            'img_srcset': ', '.join('%s %sw' % (url, size) for size, url in urls.items()),
+        }
+
+    # ----------------------------------------------------------
+    # Product navigation
+    # ----------------------------------------------------------
+
+    def _dr_get_product_nav(self, product):
+        """ :return: tuple (previous product, next product) by website sequence, None if the product is not listed """
+        neighbours = self._dr_get_product_neighbours(self._dr_get_cache_versions(['catalog', 'product_nav']), self.env.user._is_internal())
+        if product.id not in neighbours:
+            return None
+        prev_id, next_id = neighbours[product.id]
+        ProductTemplate = self.env['product.template']
+        return ProductTemplate.browse(prev_id), ProductTemplate.browse(next_id)
+
+    @tools.ormcache('self.id', 'versions', 'is_internal')
+    def _dr_get_product_neighbours(self, versions, is_internal):
+        """ product id -> (id of the last product of the lower website sequence, id of the first product of the higher one) """
+        self.env['product.template'].flush_model(['website_sequence', 'active', 'is_published', 'website_id', 'company_id'])
+        self.env.cr.execute(SQL(
+            """
+                SELECT id, website_sequence FROM product_template
+                WHERE active AND (website_id IS NULL OR website_id = %(website_id)s) AND (company_id IS NULL OR company_id = %(company_id)s) %(published)s
+                ORDER BY website_sequence, id
+            """,
+            website_id=self.id,
+            company_id=self.company_id.id,
+            published=SQL("") if is_internal else SQL("AND is_published"),
+        ))
+        sequence_groups = [[product_id for product_id, __ in rows] for __, rows in groupby(self.env.cr.fetchall(), key=lambda row: row[1])]
+        neighbours = {}
+        for index, product_ids in enumerate(sequence_groups):
+            prev_id = sequence_groups[index - 1][-1] if index else False
+            next_id = sequence_groups[index + 1][0] if index + 1 < len(sequence_groups) else False
+            neighbours.update(dict.fromkeys(product_ids, (prev_id, next_id)))
+        return neighbours
+
+    # ----------------------------------------------------------
+    # Search index
+    # ----------------------------------------------------------
+
+    # dr_search_vocabulary: words (3+ chars, lower case) of the published product, category and attribute value names
+    # in all languages, fuzzy term resolution looks them up through a trigram index.
+
+    @api.model
+    def _cron_dr_refresh_search_vocabulary(self):
+        """ Rebuild the vocabulary, new words are added on the fly so this only drops the unused ones """
+        for model_name in ['product.template', 'product.public.category', 'product.attribute.value']:
+            self.env[model_name].flush_model(['name'])
+        self.env.cr.execute("""
+            DELETE FROM dr_search_vocabulary;
+
+            INSERT INTO dr_search_vocabulary (word)
+            SELECT DISTINCT word FROM (
+                SELECT regexp_split_to_table(lower(name_translation.value), '[^[:alnum:]]+') AS word
+                FROM product_template, jsonb_each_text(product_template.name) AS name_translation
+                WHERE product_template.active AND product_template.sale_ok AND product_template.is_published
+                UNION ALL
+                SELECT regexp_split_to_table(lower(name_translation.value), '[^[:alnum:]]+')
+                FROM product_public_category, jsonb_each_text(product_public_category.name) AS name_translation
+                UNION ALL
+                SELECT regexp_split_to_table(lower(name_translation.value), '[^[:alnum:]]+')
+                FROM product_attribute_value
+                    JOIN product_attribute ON product_attribute.id = product_attribute_value.attribute_id,
+                    jsonb_each_text(product_attribute_value.name) AS name_translation
+                WHERE product_attribute.visibility = 'visible'
+            ) AS words
+            WHERE length(word) >= 3
+        """)
+
+    @api.model
+    def _dr_add_search_vocabulary(self, texts):
+        words = {word for text in texts if text for word in re.findall(r'\w+', text.lower()) if len(word) >= 3}
+        if words:
+            self.env.cr.execute("INSERT INTO dr_search_vocabulary (word) SELECT unnest(%s::varchar[]) ON CONFLICT DO NOTHING", (list(words),))
+
+    def _dr_find_fuzzy_term(self, term):
+        """ Replace the unknown words of the term by the closest word of the vocabulary (one indexed query).
+            Words that are the start of a known word are kept, they are usually still being typed (sam -> samsung).
+            Similarity threshold is the system parameter theme_prime.search_fuzzy_threshold (default 0.3).
+
+            :return: corrected term, None if pg_trgm is not installed
+        """
+        if not self.env.registry.has_trigram:
+            return None
+        words = term.split()
+        fuzzy_words = [word.lower() for word in words if len(word) >= 3]
+        if not fuzzy_words:
+            return term
+        threshold = self.env['ir.config_parameter'].sudo().get_param('theme_prime.search_fuzzy_threshold', '0.3')
+        self.env.cr.execute("""
+            SELECT set_config('pg_trgm.similarity_threshold', %(threshold)s, true);
+            SELECT term.word, CASE WHEN EXISTS (SELECT 1 FROM dr_search_vocabulary WHERE word LIKE term.prefix) THEN NULL ELSE (
+                SELECT vocabulary.word FROM dr_search_vocabulary AS vocabulary
+                WHERE vocabulary.word %% term.word
+                ORDER BY similarity(vocabulary.word, term.word) DESC, vocabulary.word
+                LIMIT 1
+            ) END
+            FROM unnest(%(words)s::varchar[], %(prefixes)s::varchar[]) AS term(word, prefix)
+        """, {
+            'threshold': str(float(threshold)),
+            'words': fuzzy_words,
+            'prefixes': [tools.escape_psql(word) + '%' for word in fuzzy_words],
+        })
+        corrections = {word: correction for word, correction in self.env.cr.fetchall() if correction and correction != word}
+        return ' '.join(corrections.get(word.lower(), word) if len(word) >= 3 else word for word in words)
+
+    def _dr_get_search_cache_key(self, search_config):
+        """ Everything the /website/dr_search result depends on, except the term.
+            The result cache is shared by all the databases of the worker, prices depend on the fiscal position taxes.
+        """
+        config_hash = hashlib.sha1(json.dumps(search_config, sort_keys=True, default=str).encode()).hexdigest()
+        versions = self._dr_get_cache_versions(['catalog', 'search_index', 'search_attributes', 'search_results'])
+        return (
+            self.env.cr.dbname, self.id, self.env.lang, self.pricelist_id.id, self.fiscal_position_id.id,
+            self.env.user.id, self._dr_has_b2b_access(), config_hash, versions,
+        )
+
+    def _dr_get_search_index(self):
+        """ In-memory index of the brand and search suggestion attribute values of the website """
+        attributes = self._get_brand_attributes() | self.env['product.attribute'].search([('visibility', '=', 'visible'), ('dr_search_suggestion', '!=', False)])
+        return self._dr_get_search_index_cached(self._dr_get_cache_version('search_index'), self.env.lang, tuple(sorted(attributes.ids)))
+
+    @tools.ormcache('self.id', 'version', 'lang', 'attribute_ids')
+    def _dr_get_search_index_cached(self, version, lang, attribute_ids):
+        # The first worker building a version stores it as snapshot, others only load it
+        self.env.cr.execute(
+            "SELECT entries FROM dr_search_index_snapshot WHERE website_id = %s AND lang = %s AND version = %s AND attribute_ids = %s::int[]",
+            (self.id, lang, version, list(attribute_ids))
+        )
+        snapshot = self.env.cr.fetchone()
+        if snapshot:
+            return DrSearchIndex(snapshot[0])
+        entries = self._dr_get_search_index_entries(attribute_ids)
+        self.env.cr.execute("""
+            INSERT INTO dr_search_index_snapshot (website_id, lang, version, attribute_ids, entries) VALUES (%s, %s, %s, %s::int[], %s::jsonb)
+            ON CONFLICT (website_id, lang) DO UPDATE SET version = EXCLUDED.version, attribute_ids = EXCLUDED.attribute_ids, entries = EXCLUDED.entries
+        """, (self.id, lang, version, list(attribute_ids), json.dumps(entries)))
+        return DrSearchIndex(entries)
+
+    def _dr_get_search_index_entries(self, attribute_ids):
+        """ :return: list of [value_id, attribute_id, ds_name] in attribute value order """
+        values = self.env['product.attribute.value'].search([('attribute_id', 'in', list(attribute_ids))])
+        return [[value.id, value.attribute_id.id, value.ds_name] for value in values if value.ds_name]
+
+
+def _dr_body_with_etag(body):
+    return body, '"%s"' % hashlib.sha1(body).hexdigest()
+
+
+class DrSearchIndex:
+    """ Case-insensitive substring matcher (same results as ``ilike``) over attribute value names.
+
+        Terms of 3+ characters are resolved through trigram postings instead of scanning all names,
+        fuzzy lookups also accept names with a word at one typo from the term.
+    """
+
+    def __init__(self, entries):
+        self.entries = entries
+        self.names = [entry[2].casefold() for entry in entries]
+        self.trigrams = defaultdict(list)
+        for index, name in enumerate(self.names):
+            for trigram in {name[i:i + 3] for i in range(len(name) - 2)}:
+                self.trigrams[trigram].append(index)
+
+    def search(self, terms, attribute_ids=None, fuzzy=False):
+        """ Entries matching any of the terms, in index order
+
+            :param terms: list of terms
+            :param attribute_ids: only match values of these attributes
+            :param fuzzy: fallback to one typo matches when a term has no exact match
+        """
+        indexes = set()
+        for term in terms:
+            term = term.casefold().strip()
+            if not term:
+                continue
+            matched = {index for index in self._candidates(term) if term in self.names[index]}
+            if not matched and fuzzy and len(term) > 3:
+                matched = self._fuzzy_candidates(term)
+            indexes |= matched
+        return [self.entries[index] for index in sorted(indexes) if attribute_ids is None or self.entries[index][1] in attribute_ids]
+
+    def _candidates(self, term):
+        if len(term) < 3:
+            return range(len(self.entries))
+        postings = sorted((self.trigrams.get(term[i:i + 3], []) for i in range(len(term) - 2)), key=len)
+        candidates = set(postings[0])
+        for posting in postings[1:]:
+            candidates.intersection_update(posting)
+            if not candidates:
+                break
+        return candidates
+
+    def _fuzzy_candidates(self, term):
+        # One edit changes at most 3 trigrams of the term
+        term_trigrams = {term[i:i + 3] for i in range(len(term) - 2)}
+        hits = Counter(index for trigram in term_trigrams for index in self.trigrams.get(trigram, []))
+        min_hits = max(len(term_trigrams) - 3, 1)
+        return {index for index, count in hits.items() if count >= min_hits and any(_dr_is_one_edit(term, word) for word in self.names[index].split())}
+
+
+def _dr_is_one_edit(term, word):
+    """ True if word is at most one insertion, deletion or substitution away from term """
+    if abs(len(term) - len(word)) > 1:
+        return False
+    if len(term) > len(word):
+        term, word = word, term
+    for i, (char_1, char_2) in enumerate(zip(term, word)):
+        if char_1 != char_2:
+            return term[i + 1:] == word[i + 1:] if len(term) == len(word) else term[i:] == word[i + 1:]
+    return True
+
+
+class DrSearchResultCache:
+    """ LRU cache with expiry of the /website/dr_search results of a worker.
+
+        Outdated entries are never hit as the key holds the cache versions, they expire or get evicted.
+        Product ids matching a term are kept with its result, a longer term only searches among them.
+    """
+
+    def __init__(self, max_size=2000, ttl=300, log_every=1000):
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+        self.max_size, self.ttl, self.log_every = max_size, ttl, log_every
+        self.stats = Counter()
+
+    def _get(self, key):
+        entry = self.entries.get(key)
+        if entry is None:
+            return None
+        if entry[0] < time.monotonic():
+            del self.entries[key]
+            return None
+        self.entries.move_to_end(key)
+        return entry[1]
+
+    def lookup(self, cache_key, term):
+        """ :return: cached value of the term, product ids of the longest cached prefix (None if unknown) """
+        with self.lock:
+            value = self._get((cache_key, term))
+            prefix_product_ids = None
+            if value is None:
+                for length in range(len(term) - 1, 0, -1):
+                    prefix_value = self._get((cache_key, term[:length]))
+                    if prefix_value is not None and prefix_value[1] is not None:
+                        prefix_product_ids = prefix_value[1]
+                        break
+            self.stats['hit' if value is not None else 'prefix_hit' if prefix_product_ids is not None else 'miss'] += 1
+            lookups = self.stats.total()
+        if not lookups % self.log_every:
+            _logger.info("dr_search cache: %s", self.get_stats())
+        return value, prefix_product_ids
+
+    def set(self, cache_key, term, value):
+        with self.lock:
+            self.entries[(cache_key, term)] = (time.monotonic() + self.ttl, value)
+            self.entries.move_to_end((cache_key, term))
+            while len(self.entries) > self.max_size:
+                self.entries.popitem(last=False)
+
+    def get_stats(self):
+        lookups = self.stats.total()
+        return {**self.stats, 'size': len(self.entries), 'hit_rate': lookups and round(self.stats['hit'] / lookups, 3)}
+
+
+dr_search_cache = DrSearchResultCache()
+
+
+class DrRenderCache:
+    """ Bounded LRU cache of the html rendered by a worker (snippet fragments, quick views).
+
+        Entries are never invalidated, outdated ones are not hit anymore as the key holds what the html depends on
+        and get evicted. Hit/miss statistics are logged every ``log_every`` lookups.
+    """
+
+    def __init__(self, max_size=5000, log_every=5000):
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+        self.max_size, self.log_every = max_size, log_every
+        self.stats = Counter()
+
+    def get_or_render(self, key, render):
+        """ :param render: callable returning the value of the key, only called on a miss """
+        with self.lock:
+            value = self.entries.get(key)
+            if value is not None:
+                self.entries.move_to_end(key)
+            self.stats['hit' if value is not None else 'miss'] += 1
+            lookups = self.stats.total()
+        if not lookups % self.log_every:
+            _logger.info("Rendering cache: %s", self.get_stats())
+        if value is None:
+            value = render()
+            with self.lock:
+                self.entries[key] = value
+                while len(self.entries) > self.max_size:
+                    self.entries.popitem(last=False)
+        return value
+
+    def get_stats(self):
+        lookups = self.stats.total()
+        return {**self.stats, 'size': len(self.entries), 'hit_rate': lookups and round(self.stats['hit'] / lookups, 3)}
+
+
+dr_render_cache = DrRenderCache()
+
+
+class DrTermMatcher:
+    """ Aho-Corasick automaton over the words of a search query.
+
+        A single pass over a text finds every occurrence of every word (case-insensitive),
+        it is used for both the word matching of the autocomplete and the highlighting.
+    """
+
+    def __init__(self, words):
+        self.goto, self.fail, self.output = [{}], [0], [[]]
+        for word in dict.fromkeys(self.fold(word) for word in words if word):
+            state = 0
+            for char in word:
+                if char not in self.goto[state]:
+                    self.goto[state][char] = len(self.goto)
+                    self.goto.append({})
+                    self.fail.append(0)
+                    self.output.append([])
+                state = self.goto[state][char]
+            self.output[state].append(word)
+
+        queue = deque(self.goto[0].values())
+        while queue:
+            state = queue.popleft()
+            for char, next_state in self.goto[state].items():
+                queue.append(next_state)
+                fail_state = self.fail[state]
+                while fail_state and char not in self.goto[fail_state]:
+                    fail_state = self.fail[fail_state]
+                self.fail[next_state] = self.goto[fail_state].get(char, 0)
+                self.output[next_state] = self.output[next_state] + self.output[self.fail[next_state]]
+
+    @staticmethod
+    def fold(text):
+        # Lower case char by char so offsets stay valid in the original text
+        return ''.join(char.lower() if len(char.lower()) == 1 else char for char in text)
+
+    def finditer(self, text):
+        """ Yield (start, end, folded word) of all the occurrences, overlapping ones included """
+        state = 0
+        for index, char in enumerate(self.fold(text)):
+            while state and char not in self.goto[state]:
+                state = self.fail[state]
+            state = self.goto[state].get(char, 0)
+            for word in self.output[state]:
+                yield index - len(word) + 1, index + 1, word
+
+    def search(self, text):
+        """ :return: set of the folded words found in the text """
+        return {word for __, __, word in self.finditer(text)}
+
+    def highlight(self, text):
+        """ Escaped markup of the text with the longest leftmost occurrences highlighted, False if nothing matched """
+        parts, position = [], 0
+        for start, end, __ in sorted(self.finditer(text), key=lambda occurrence: (occurrence[0], -occurrence[1])):
+            if start >= position:
+                parts.append(escape(text[position:start]))
+                parts.append(Markup('<span class="text-primary-emphasis">%s</span>') % text[start:end])
+                position = end
+        if not parts:
+            return False
+        parts.append(escape(text[position:]))
+        return Markup('').join(parts)
+
+
+@functools.lru_cache(maxsize=256)
+def dr_term_matcher(words):
+    """ Shared matcher of a tuple of words, the same query words come from many visitors """
+    return DrTermMatcher(words)
@@ -259,6 +259,8 @@ export let CategoryPublicWidgetMixins = {
         }
         options['categoryIDs'] = categoryIDs;
         options['categoryID'] = this.initialCategory;
+        // Bestseller ranking of the category (theme_prime.bestseller_per_category)
+        options['category_id'] = !this.isBrand && this.initialCategory;
         return options;
     },
     /**
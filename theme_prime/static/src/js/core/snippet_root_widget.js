@@ -10,6 +10,65 @@ import { _t } from "@web/core/l10n/translation";
 import { markup } from "@odoo/owl";
 import { closestScrollable } from "@web_editor/js/common/scrolling";
 
+// Snippet routes served by /theme_prime/get_snippets_data
+const BATCHED_SNIPPET_ROUTES = [
+    '/theme_prime/get_products_data',
+    '/theme_prime/get_listing_products',
+    '/theme_prime/get_tab_listing_products',
+    '/theme_prime/get_products_by_category',
+    '/theme_prime/get_brands_category_data',
+    '/theme_prime/get_top_categories',
+    '/theme_prime/get_categories_info',
+    '/theme_prime/get_brands',
+    '/theme_prime/get_megamenu_categories',
+];
+// Max requests of one batch (SNIPPET_DATA_BATCH_LIMIT of the controller)
+const SNIPPET_BATCH_LIMIT = 50;
+let pendingSnippetRequests = [];
+
+function sendSnippetRequests(snippetRequests) {
+    if (snippetRequests.length === 1) {
+        const { route, params, resolve, reject } = snippetRequests[0];
+        rpc(route, params).then(resolve, reject);
+        return;
+    }
+    rpc('/theme_prime/get_snippets_data', {
+        'snippet_requests': snippetRequests.map(({ route, params }) => ({ route, params })),
+    }).then(results => {
+        snippetRequests.forEach((snippetRequest, index) => {
+            const res = results[index];
+            if (!res || res.error) {
+                snippetRequest.reject(new Error(`Snippet request ${snippetRequest.route} failed`));
+            } else {
+                snippetRequest.resolve(res.result);
+            }
+        });
+    }, error => snippetRequests.forEach(snippetRequest => snippetRequest.reject(error)));
+}
+
+function flushSnippetRequests() {
+    const snippetRequests = pendingSnippetRequests;
+    pendingSnippetRequests = [];
+    for (let index = 0; index < snippetRequests.length; index += SNIPPET_BATCH_LIMIT) {
+        sendSnippetRequests(snippetRequests.slice(index, index + SNIPPET_BATCH_LIMIT));
+    }
+}
+
+/**
+ * Requests of the snippets starting in the same tick are sent in one batched RPC.
+ */
+export function fetchSnippetData(route, params) {
+    if (!BATCHED_SNIPPET_ROUTES.includes(route)) {
+        return rpc(route, params);
+    }
+    return new Promise((resolve, reject) => {
+        if (!pendingSnippetRequests.length) {
+            setTimeout(flushSnippetRequests);
+        }
+        pendingSnippetRequests.push({ route, params, resolve, reject });
+    });
+}
+
 const ThemePrimeRootWidget = publicWidget.Widget.extend(primeUtilities, {
     disabledInEditableMode: false,
     controllerRoute: false,
@@ -300,7 +359,7 @@ const ThemePrimeRootWidget = publicWidget.Widget.extend(primeUtilities, {
      * @private
      */
     _fetchData: async function (params) {
-        return await rpc(this.controllerRoute, params);
+        return await fetchSnippetData(this.controllerRoute, params);
     },
 
     /**
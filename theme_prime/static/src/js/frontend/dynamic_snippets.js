@@ -3,8 +3,7 @@
 import "@website/js/content/menu";
 import publicWidget from "@web/legacy/js/public/public_widget";
 import ProductRootWidget from "@theme_prime/js/core/product_root_widget";
-import RootWidget from "@theme_prime/js/core/snippet_root_widget";
-import { rpc } from "@web/core/network/rpc";
+import RootWidget, { fetchSnippetData } from "@theme_prime/js/core/snippet_root_widget";
 import { SIZES, utils as uiUtils } from "@web/core/ui/ui_service";
 import animations from "@website/js/content/snippets.animation";
 import { OwlMixin, MarkupRecords, ProductsBlockMixins, CategoryPublicWidgetMixins, ProductCarouselMixins, CartManagerMixin, HotspotMixns, cartMixin, TabsMixin } from "@theme_prime/js/core/mixins";
@@ -254,7 +253,7 @@ publicWidget.registry.s_category_snippet = ProductRootWidget.extend(OwlMixin, Ma
         if (this.isBrand) {
             domain = [['attribute_line_ids.value_ids', 'in', [categoryID]]];
         }
-        return { domain: domain, options:{order: sortBy,limit: limit} ,fields: this.fieldstoFetch};
+        return { domain: domain, options:{order: sortBy, limit: limit, category_id: !this.isBrand && categoryID}, fields: this.fieldstoFetch};
     },
     /**
      * initialize owlCarousel.
@@ -1083,7 +1082,8 @@ publicWidget.registry.tp_image_hotspot = publicWidget.Widget.extend(HotspotMixns
      * @returns {Promise}
      */
     _fetchData: async function () {
-        return await rpc('/theme_prime/get_products_data', {
+        // Hotspots of the page are fetched in one batch
+        return await fetchSnippetData('/theme_prime/get_products_data', {
             'domain': [['id', 'in', [parseInt(this.$target.get(0).dataset.productId)]]],
             'fields': ['description_ecommerce', 'rating'],
             'limit': 1
@@ -1,10 +1,29 @@
 var cacheVersion = "##1##";
 var offlinePage = "##2##";
+// Max entries of the runtime caches, 0 disables the cache
+var assetCacheSize = "##3##";
+var imageCacheSize = "##4##";
+var pageCacheSize = "##5##";
 
 const offlineUrl = '/pwa/offline_page';
 var currentCache = {
-    offline: 'offline-cache' + cacheVersion
+    offline: 'offline-cache' + cacheVersion,
+    assets: 'asset-cache' + cacheVersion,
+    images: 'image-cache' + cacheVersion,
+    pages: 'page-cache' + cacheVersion,
+    session: 'page-session-cache' + cacheVersion,
 };
+// Session state of the cached pages (X-Dr-Session-State header of the website pages, "private" when not cacheable)
+const sessionStateUrl = '/__dr_page_session_state';
+
+// Hashed asset bundles (/web/assets/<unique>/<bundle>), never changes for a given url
+const assetRegex = /^\/web\/assets\/[0-9a-f]{7,}\//;
+// Product images with the unique (write date) query parameter
+const imageRegex = /^\/web\/image\/product\.(template|product|image|public\.category)\//;
+// Product card images (WebP/AVIF negotiated), the url holds the unique part
+const productImageRegex = /^\/theme_prime\/product_image\/\d+-[0-9a-f]+\/\d+$/;
+// Category and product pages (with optional language prefix)
+const pageRegex = /^(\/[a-z]{2}(_[a-z0-9@]+)?)?\/shop\/(category\/[^/]+-\d+(\/page\/\d+)?|[^/]+-\d+)\/?$/i;
 
 self.addEventListener('install', event => {
     // At this point everything has been cached
@@ -22,6 +41,8 @@ self.addEventListener('install', event => {
 self.addEventListener('activate', function (event) {
     var cacheWhitelist = []; // add cache names which you do not want to delete
     cacheWhitelist.push(currentCache.offline);
+    // Runtime caches of the previous versions are evicted
+    cacheWhitelist.push(currentCache.assets, currentCache.images, currentCache.pages, currentCache.session);
     event.waitUntil(
         caches.keys().then(function (cacheNames) {
             return Promise.all(
@@ -35,56 +56,148 @@ self.addEventListener('activate', function (event) {
     );
 });
 
-if (offlinePage) {
+/**
+ * Drop the oldest entries so the cache keeps at most maxEntries
+ * (cache keys are in insertion order and a put moves the entry to the end).
+ */
+function trimCache(cache, maxEntries) {
+    return cache.keys().then(function (keys) {
+        return Promise.all(keys.slice(0, Math.max(keys.length - maxEntries, 0)).map(key => cache.delete(key)));
+    });
+}
 
-    self.addEventListener('fetch', event => {
-        const url = new URL(event.request.url);
-        if (event.request.method !== 'GET') {
-            return;
-        }
+function putInCache(cacheName, maxEntries, request, response) {
+    if (!response || !response.ok || response.type !== 'basic' || response.redirected) {
+        return Promise.resolve();
+    }
+    return caches.open(cacheName).then(function (cache) {
+        return cache.put(request, response).then(() => trimCache(cache, maxEntries));
+    });
+}
 
-        if (url.origin === location.origin) {
-            if (event.clientId === "" && // Not fetched via AJAX after page load.
-                event.request.method == "GET" && // Don't fetch on POST, DELETE, etc.
-                !url.href.includes('.css') && // Don't run on CSS.
-                !url.href.includes('.js') && // Don't run on JS.
-                !url.href.includes('/web') && // Don't run for backend.
-                !url.href.includes('/manifest.json') && // Don't run manifest.
-                (!url.href.includes('/static/src') || url.href.includes('pwa_offline.png'))// Don't run for static.
-                ) {
-                // request.mode = navigate isn't supported in all browsers
-                // so include a check for Accept: text/html header.
-                if ((event && event.request && event.request.mode === 'navigate') || (event.request.method === 'GET' && event.request.headers.get('accept').includes('text/html'))) {
-                    event.respondWith(
-                        fetch(event.request)
-                        .then(function (response) {
-                            return response;
-                        })
-                        .catch(error => {
-                            // Return the offline page
-                            return caches.match(offlineUrl);
-                    }));
-                }
-            }
-            if (event.request.method === 'GET' &&
-                (
-                    url.href.includes('/pwa/offline_page') ||
-                    url.href.includes('/pwa_offline.png') ||
-                    url.href.includes('/pwa/logo.png')
-                )
-            ) {
-                event.respondWith(caches.match(event.request)
-                    .then(function (response) {
-                        return response || fetch(event.request);
-                    })
-                );
+/**
+ * Pages of the previous session (login, logout, pricelist, cart) are dropped when the session state changes.
+ */
+function checkSessionState(response) {
+    const state = response.headers.get('X-Dr-Session-State');
+    if (!state) {
+        return Promise.resolve();
+    }
+    return caches.open(currentCache.session).then(function (cache) {
+        return cache.match(sessionStateUrl).then(stored => stored ? stored.text() : null).then(function (previousState) {
+            if (previousState === state) {
+                return;
             }
+            return caches.delete(currentCache.pages).then(() => cache.put(sessionStateUrl, new Response(state)));
+        });
+    });
+}
+
+function isCacheablePage(response) {
+    const cacheControl = response.headers.get('Cache-Control') || '';
+    const state = response.headers.get('X-Dr-Session-State');
+    return state && state !== 'private' && !cacheControl.includes('private') && !cacheControl.includes('no-store');
+}
+
+function cacheFirst(event, cacheName, maxEntries) {
+    event.respondWith(caches.match(event.request, {cacheName: cacheName}).then(function (cachedResponse) {
+        if (cachedResponse) {
+            return cachedResponse;
         }
+        return fetch(event.request).then(function (response) {
+            event.waitUntil(putInCache(cacheName, maxEntries, event.request, response.clone()));
+            return response;
+        });
+    }));
+}
 
-    });
+function staleWhileRevalidate(event, cacheName, maxEntries) {
+    event.respondWith(caches.match(event.request, {cacheName: cacheName}).then(function (cachedResponse) {
+        const networkResponse = fetch(event.request).then(function (response) {
+            return checkSessionState(response).then(function () {
+                if (isCacheablePage(response)) {
+                    return putInCache(cacheName, maxEntries, event.request, response.clone());
+                }
+            }).then(() => response);
+        });
+        // Cache is refreshed in the background even when the cached page is returned
+        event.waitUntil(networkResponse.catch(() => {}));
+        if (cachedResponse) {
+            return cachedResponse;
+        }
+        return networkResponse.catch(function (error) {
+            if (offlinePage) {
+                return caches.match(offlineUrl);
+            }
+            throw error;
+        });
+    }));
+}
 
-} else {
-    // Without this PWA option will not be displayed
-    // When offline page is disabled
-    self.addEventListener('fetch', event => { });
+function isPageRequest(event) {
+    // request.mode = navigate isn't supported in all browsers
+    // so include a check for Accept: text/html header.
+    return event.request.mode === 'navigate' || (event.request.headers.get('accept') || '').includes('text/html');
 }
+
+// Without a fetch handler PWA option will not be displayed
+// (even when offline page and runtime caches are disabled)
+self.addEventListener('fetch', event => {
+    const url = new URL(event.request.url);
+    if (event.request.method !== 'GET' || url.origin !== location.origin || event.request.headers.has('range')) {
+        return;
+    }
+
+    if (assetCacheSize && assetRegex.test(url.pathname)) {
+        return cacheFirst(event, currentCache.assets, assetCacheSize);
+    }
+    if (imageCacheSize && ((imageRegex.test(url.pathname) && url.searchParams.has('unique')) || productImageRegex.test(url.pathname))) {
+        return cacheFirst(event, currentCache.images, imageCacheSize);
+    }
+    if (pageCacheSize && event.clientId === "" && isPageRequest(event)) {
+        if (pageRegex.test(url.pathname)) {
+            return staleWhileRevalidate(event, currentCache.pages, pageCacheSize);
+        }
+        // Every navigation tells whether the session changed (e.g. home page after the logout)
+        event.respondWith(fetch(event.request).then(function (response) {
+            event.waitUntil(checkSessionState(response));
+            return response;
+        }).catch(function (error) {
+            if (offlinePage) {
+                return caches.match(offlineUrl);
+            }
+            throw error;
+        }));
+        return;
+    }
+
+    if (!offlinePage) {
+        return;
+    }
+    if (event.clientId === "" && // Not fetched via AJAX after page load.
+        !url.href.includes('.css') && // Don't run on CSS.
+        !url.href.includes('.js') && // Don't run on JS.
+        !url.href.includes('/web') && // Don't run for backend.
+        !url.href.includes('/manifest.json') && // Don't run manifest.
+        (!url.href.includes('/static/src') || url.href.includes('pwa_offline.png')) && // Don't run for static.
+        isPageRequest(event)
+        ) {
+        event.respondWith(
+            fetch(event.request)
+            .catch(error => {
+                // Return the offline page
+                return caches.match(offlineUrl);
+        }));
+        return;
+    }
+    if (url.href.includes('/pwa/offline_page') ||
+        url.href.includes('/pwa_offline.png') ||
+        url.href.includes('/pwa/logo.png')
+    ) {
+        event.respondWith(caches.match(event.request)
+            .then(function (response) {
+                return response || fetch(event.request);
+            })
+        );
+    }
+});
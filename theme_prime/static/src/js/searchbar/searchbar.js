@@ -8,6 +8,50 @@ import { markup } from "@odoo/owl";
 
 let {searchBar} = searchExports;
 
+const RESULT_CACHE_KEY = 'dr_search_results';
+const RESULT_CACHE_SIZE = 30;
+const REPORT_QUEUE_KEY = 'dr_search_reports';
+const REPORT_QUEUE_SIZE = 10;
+
+/**
+ * Small LRU of the recent search results of the session (insertion order of the object keys).
+ */
+const searchResultCache = {
+    _load: function () {
+        try {
+            return JSON.parse(sessionStorage.getItem(RESULT_CACHE_KEY)) || {};
+        } catch {
+            return {};
+        }
+    },
+    _save: function (entries) {
+        try {
+            sessionStorage.setItem(RESULT_CACHE_KEY, JSON.stringify(entries));
+        } catch {
+            sessionStorage.removeItem(RESULT_CACHE_KEY);
+        }
+    },
+    get: function (key) {
+        const entries = this._load();
+        if (!(key in entries)) {
+            return false;
+        }
+        const result = entries[key];
+        delete entries[key];
+        entries[key] = result;
+        this._save(entries);
+        return result;
+    },
+    set: function (key, result) {
+        const entries = this._load();
+        delete entries[key];
+        entries[key] = result;
+        const keys = Object.keys(entries);
+        keys.slice(0, Math.max(keys.length - RESULT_CACHE_SIZE, 0)).forEach(oldKey => delete entries[oldKey]);
+        this._save(entries);
+    },
+};
+
 
 searchBar.include(Object.assign({}, B2bMixin, {
 
@@ -32,12 +76,29 @@ searchBar.include(Object.assign({}, B2bMixin, {
         this.isB2bActive = this._isB2bModeEnabled();
         if (this.advanceMode) {
             this.searchType = 'droggol';
-            const res = await rpc('/website/dr_search', {
+            const params = {
                 'term': this.$input.val(),
                 'max_nb_chars': Math.round(Math.max(this.autocompleteMinWidth, parseInt(this.$el.width())) * 0.22),
                 'options': this.options,
                 'device_type': isMobileOS() ? 'mobile': 'desktop',
-            });
+            };
+            // Results are translated and priced, they depend on the language and the pricelist
+            const lang = document.documentElement.getAttribute('lang');
+            const pricelistId = document.documentElement.dataset.pricelistId;
+            const cacheKey = JSON.stringify([params.term.trim().toLowerCase(), params.max_nb_chars, params.options, this.isB2bActive, lang, pricelistId]);
+            let res = searchResultCache.get(cacheKey);
+            if (!res) {
+                // Superseded request is dropped by the searchbar anyway, abort it to free the connection
+                // (its reports are not queued again, the server may already have received them)
+                if (this._searchRequest) {
+                    this._searchRequest.abort(false);
+                }
+                const reports = this._popSearchReports();
+                this._searchRequest = rpc('/website/dr_search', Object.assign(params, reports.length ? {'reports': reports} : {}));
+                res = await this._searchRequest;
+                this._searchRequest = false;
+                searchResultCache.set(cacheKey, res);
+            }
 
             if (this.search_reports) {
                 this.searchReportData = {
@@ -94,9 +155,34 @@ searchBar.include(Object.assign({}, B2bMixin, {
         } else { this._super.apply(this, arguments); }
     },
 
+    /**
+     * Queue the report, it is sent with the next search (on this page or the next one).
+     * The queue is only sent on its own when it gets full.
+     */
     _addSearchReport: function (searchReportData) {
         searchReportData['device_type'] = isMobileOS() ? 'mobile': 'desktop';
-        rpc('/website/dr_search/add_report', searchReportData);
+        const reports = this._getSearchReports();
+        reports.push(searchReportData);
+        if (reports.length >= REPORT_QUEUE_SIZE) {
+            sessionStorage.removeItem(REPORT_QUEUE_KEY);
+            rpc('/website/dr_search/add_report', {'reports': reports});
+        } else {
+            sessionStorage.setItem(REPORT_QUEUE_KEY, JSON.stringify(reports));
+        }
+    },
+
+    _getSearchReports: function () {
+        try {
+            return JSON.parse(sessionStorage.getItem(REPORT_QUEUE_KEY)) || [];
+        } catch {
+            return [];
+        }
+    },
+
+    _popSearchReports: function () {
+        const reports = this._getSearchReports();
+        sessionStorage.removeItem(REPORT_QUEUE_KEY);
+        return reports;
     },
 
     _onClickSearchResult: function (ev) {